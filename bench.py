@@ -0,0 +1,209 @@
+#!/usr/local/bin/python3
+#
+# Usage: bench.py [-r REPEATS] [-u WARMUP] [-x SCALES] [-o OUTPUT]
+#                 [WATCH_FILE ...]
+# Times 'get_watch()' on every file in folder 'watches', or on the passed
+# files, and on their scaled-up variants, whose numeric positions get
+# multiplied by each of the comma separated SCALES. Each watch is rendered
+# WARMUP times before it is timed REPEATS times. Results with median and
+# percentiles of times, peak memory and size of the output of each watch get
+# saved to OUTPUT as JSON ('-' for stdout), so runs on different commits can be
+# compared.
+
+
+import ast
+import json
+import os
+import platform
+import sys
+import tracemalloc
+from collections import namedtuple
+from numbers import Real
+from time import perf_counter
+
+from parse import WATCHES_DIR, get_watch, get_watch_paths, \
+    get_subface_symbols
+from src.fii import FII_CACHE
+from src.fonts import clear_fonts
+from src.model import get_parts
+from src.options import OptInfo, get_option_values
+from src.ranges import compute_angular_width
+from src.raster import get_watch_layout
+from src.svg import GLYPHS
+from src.util import compile_exp, read_file
+
+
+PERCENTILES = (50, 90, 99)
+# Shapes whose positions get multiplied in scaled-up variants. Positions of
+# numbers are left alone, since their text depends on them.
+SCALED_SHAPES = {'line', 'rounded_line', 'two_lines', 'circle', 'triangle',
+                 'upside_triangle', 'square'}
+
+Case = namedtuple('Case', ['name', 'scale', 'watch'])
+Result = namedtuple('Result', ['name', 'scale', 'runs', 'min_ms',
+                               'median_ms', 'p90_ms', 'p99_ms', 'peak_kb',
+                               'output_bytes'])
+
+OPTIONS = (
+    OptInfo('repeats', 'r', True, int, 10),
+    OptInfo('warmup', 'u', True, int, 2),
+    OptInfo('scales', 'x', True, str, '1,4'),
+    OptInfo('output', 'o', True, str, 'bench_output.json')
+)
+
+
+###
+##  MAIN
+#
+
+def main():
+    repeats, warmup, scales, output, args = get_option_values(OPTIONS,
+                                                              sys.argv)
+    if repeats < 1:
+        print('Number of repeats must be at least 1.', file=sys.stderr)
+        sys.exit(2)
+    scales = [int(a) for a in scales.split(',')]
+    paths = [f'{WATCHES_DIR}/{a}' for a in args] if args else \
+        sorted(get_watch_paths(WATCHES_DIR))
+    cases = get_cases(paths, scales)
+    results = [bench_case(a, repeats, warmup) for a in cases]
+    report = get_report(results, repeats, warmup)
+    write_report(report, output)
+
+
+def get_cases(paths, scales):
+    out = []
+    for path in paths:
+        watch = ''.join(read_file(path))
+        name = os.path.basename(path)
+        for scale in scales:
+            scaled = watch if scale == 1 else scale_watch(watch, scale)
+            out.append(Case(name, scale, scaled))
+    return out
+
+
+def write_report(report, output):
+    text = json.dumps(report, indent=2)
+    if output == '-':
+        print(text)
+        return
+    with open(output, 'w', encoding='utf-8') as file:
+        file.write(text + '\n')
+    total = report['total']
+    print(f'Sum of medians: {total["sum_of_medians_ms"]:.1f} ms, written to '
+          f'"{output}".', file=sys.stderr)
+
+
+###
+##  SCALE
+#
+
+def scale_watch(watch, scale):
+    """Returns watch string with numeric positions of the bezel and face
+    markers multiplied by scale, so there are more objects to lay out and
+    render. Positions in subfaces and in variables are left as they are."""
+    parts = ast.literal_eval(watch)
+    variables, bezel, face = get_parts(parts)
+    bezel = scale_groups(bezel, scale)
+    face = scale_groups(face, scale)
+    if bezel is None:
+        return repr([variables, face])
+    return repr([variables, bezel, face])
+
+
+def scale_groups(groups, scale):
+    if not groups:
+        return groups
+    return [[group[0], *(scale_subgroup(a, scale) for a in group[1:])]
+            for group in groups]
+
+
+def scale_subgroup(subgroup, scale):
+    pos, shape_name = subgroup[:2]
+    if shape_name.split()[0] not in SCALED_SHAPES:
+        return subgroup
+    if isinstance(pos, Real):
+        pos *= scale
+    elif isinstance(pos, dict) and isinstance(pos.get('pos'), Real):
+        pos = {**pos, 'pos': pos['pos'] * scale}
+    return [pos, *subgroup[1:]]
+
+
+###
+##  BENCH
+#
+
+def bench_case(case, repeats, warmup):
+    """All caches get cleared before each run, so every run is cold, like
+    the first render of a watch in a new process. Memory is measured in a
+    separate run, since tracing slows down the rendering."""
+    print(f'Benchmarking "{case.name}" x{case.scale}.', file=sys.stderr)
+    for _ in range(warmup):
+        render(case.watch)
+    times = []
+    for _ in range(repeats):
+        start = perf_counter()
+        svg = render(case.watch)
+        times.append(perf_counter() - start)
+    peak = get_peak_memory(case.watch)
+    return get_result(case, times, peak, len(svg.encode()))
+
+
+def render(watch):
+    clear_caches()
+    return get_watch(watch)
+
+
+def clear_caches():
+    for cache in (get_subface_symbols, compile_exp, compute_angular_width,
+                  get_watch_layout):
+        cache.cache_clear()
+    FII_CACHE.clear()
+    GLYPHS.clear()
+    clear_fonts()
+
+
+def get_peak_memory(watch):
+    """Returns peak of memory that was allocated during the rendering in
+    bytes."""
+    tracemalloc.start()
+    try:
+        render(watch)
+        return tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+
+
+def get_result(case, times, peak, output_bytes):
+    times_ms = sorted(a * 1000 for a in times)
+    median, p90, p99 = (get_percentile(times_ms, a) for a in PERCENTILES)
+    return Result(case.name, case.scale, len(times), round(times_ms[0], 3),
+                  median, p90, p99, round(peak / 1024, 1), output_bytes)
+
+
+def get_percentile(values, percent):
+    """Returns the percentile of sorted values using the nearest rank."""
+    if not values:
+        return None
+    rank = max(1, -(-len(values) * percent // 100))
+    return round(values[rank-1], 3)
+
+
+###
+##  REPORT
+#
+
+def get_report(results, repeats, warmup):
+    medians = sorted(a.median_ms for a in results)
+    total = {'sum_of_medians_ms': round(sum(medians), 3),
+             'peak_kb': max((a.peak_kb for a in results), default=0),
+             'output_bytes': sum(a.output_bytes for a in results)}
+    return {'python': platform.python_version(),
+            'repeats': repeats,
+            'warmup': warmup,
+            'total': total,
+            'watches': [a._asdict() for a in results]}
+
+
+if __name__ == '__main__':
+    main()
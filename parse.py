@@ -1,45 +1,77 @@
 #!/usr/local/bin/python3
 #
-# Usage: parse.py WATCH_FILE
+# Usage: parse.py [-l MAX_LINES] [-j JOBS] [-w] [-o OUTPUT] [-i] [-p PRECISION]
+#                 [-s SIZE] [-r REPORT] [-a ADDRESS] [-t] [WATCH_FILE]
 # Generates watch face image from passed watch file and saves it to 
-# 'index.html'. If no argument is specified, then all files in folder 'watches'
-# get parsed.
-
-
-import ast
+# 'index.html' or OUTPUT ('-' for stdout, gzipped if it ends with '.gz'). If no
+# argument is specified, then all files in folder 'watches' get parsed, using
+# JOBS processes. With '-w' it keeps running and regenerates the images of
+# watches whose files changed. With '-i' repeated objects get drawn as rotated
+# uses of a single symbol. With '-p' numbers get rounded to PRECISION decimal
+# places. If OUTPUT ends with '.png', a SIZE pixels wide thumbnail of the watch
+# or an atlas of thumbnails of all watches gets rendered instead. With '-r'
+# ('--profile') watches get parsed in a single process, and times and counters
+# of the stages of rendering get saved to REPORT as JSON ('-' for stderr).
+# With '-a' ('--serve') it serves svgs of watches over HTTP on ADDRESS
+# ('[HOST:]PORT') instead, rendering them in a pool of JOBS processes.
+# With '-t' ('--outlines') texts get drawn as outlines of glyphs from the
+# font files instead of as text elements. Substituted models of watch files
+# get cached in folder 'bundles'.
+
+
+import gzip
+import json
 import os
 import sys
-from collections import namedtuple
+import traceback
+from collections import deque, namedtuple
+from concurrent.futures import ProcessPoolExecutor
+from functools import lru_cache, partial
 from math import ceil, sqrt
-
-from src.fii import get_fii
-from src.fonts import get_font_def, FONTS_ALIASES
+from time import sleep
+
+from src.bundle import get_bundled_model
+from src.fonts import FONTS_FOLDER, add_used_chars, clear_fonts, \
+    get_font_defs
+from src.layout import INVERT_COLOR, VER_BORDER, get_layout
+from src.model import DIAMETER_KEY, RADIUS_KEY, Watch, get_repr, \
+    get_watch_def, get_watch_model
 from src.options import OptInfo, get_option_values
-from src.ranges import GrpRanges, range_occupied, update_ranges, pos_occupied, \
-    get_angular_width
+from src.raster import get_thumbnail, get_atlas, get_png
+from src.server import serve
 from src.shape import Shape
-from src.svg import get_shape
-from src.util import replace_matched_items, read_file, write_to_file, get_enum, \
-    check_args, get_rad, get_point, add_defaults
+from src.stats import count, enable, get_report
+from src.svg import get_renderer, get_instances, round_numbers
+from src.util import read_file, get_point, get_hash, get_names
 
 
-INVERT_COLOR = False
-
 BASE = 0.75
 HEAD = f'<html>\n'
 TAIL = "\n</html>"
 WATCHES_DIR = 'watches'
-VER_BORDER = 2
+BUNDLES_DIR = 'bundles'
 ALL_WIDTH = 250
-RADIUS_KEY = 'RADIUS'
-DIAMETER_KEY = 'DIAMETER'
-UNIT_KEY = 'UNIT'
+POLL_INTERVAL = 0.5
+FILES_AHEAD_PER_JOB = 2
+# Number of rendered subfaces that are kept.
+SUBFACES_CACHE_SIZE = 128
+PNG_EXT = '.png'
 
-ObjParams = namedtuple('ObjParams', ['shape', 'r', 'fi', 'args', 'color'])
 ShapeTup = namedtuple('ShapeTup', ['shape', 'fixed'])
+OutFormat = namedtuple('OutFormat', ['parse', 'get_gallery', 'get_single',
+                                     'write'])
 
 OPTIONS = (
-    OptInfo('max_lines', 'l', True, int, 5)
+    OptInfo('max_lines', 'l', True, int, 5),
+    OptInfo('jobs', 'j', True, int, 1),
+    OptInfo('watch', 'w', False, bool, False),
+    OptInfo('output', 'o', True, str, 'index.html'),
+    OptInfo('instancing', 'i', False, bool, False),
+    OptInfo('precision', 'p', True, int, None),
+    OptInfo('size', 's', True, int, 200),
+    OptInfo('profile', 'r', True, str, None),
+    OptInfo('serve', 'a', True, str, None),
+    OptInfo('outlines', 't', False, bool, False)
 )
 
 
@@ -48,64 +80,300 @@ OPTIONS = (
 #
 
 def main():
-    max_lines, args = get_option_values(OPTIONS, sys.argv)
+    max_lines, jobs, watch, output, instancing, precision, size, profile, \
+        address, outlines, args = get_option_values(OPTIONS, sys.argv)
+    if address:
+        render = partial(get_watch, instancing=instancing, precision=precision,
+                         outlines=outlines)
+        serve(address, render, WATCHES_DIR, jobs)
+        return
+    if profile:
+        enable(get_profiled_stages())
+        jobs = 1
+    out_format = get_out_format(output, instancing, precision, size,
+                                outlines)
+    run(args, max_lines, jobs, watch, output, out_format)
+    if profile:
+        write_report(profile)
+
+
+def run(args, max_lines, jobs, watch, output, out_format):
     if len(args) < 1:
-        svg = parse_all_watches(WATCHES_DIR, max_lines)
+        if watch:
+            get_paths = partial(get_watch_paths, WATCHES_DIR)
+            get_page = lambda results: \
+                out_format.get_gallery(results, len(results), max_lines)
+            watch_files(get_paths, get_page, jobs, output, out_format)
+            return
+        failed = []
+        page = parse_all_watches(WATCHES_DIR, max_lines, jobs, out_format,
+                                 failed)
+        out_format.write(page, output)
+        if failed:
+            print(f'Failed to parse {len(failed)} watches.', file=sys.stderr)
+            sys.exit(1)
     else:
         filename = f'{WATCHES_DIR}/{args[0]}'
-        svg = parse_single_watch(filename)
-    write_to_file('index.html', f'{get_head()} {svg} {TAIL}')
+        if not os.path.isfile(filename):
+            print(f'File "{filename}" does not exist.', file=sys.stderr)
+            sys.exit(2)
+        if watch:
+            get_page = lambda results: out_format.get_single(results[0])
+            watch_files(lambda: [filename], get_page, jobs, output,
+                        out_format)
+            return
+        page = out_format.get_single(out_format.parse(filename))
+        out_format.write(page, output)
+
+
+def get_out_format(output, instancing, precision, size, outlines):
+    """Returns functions that parse a watch file, assemble the page of a
+    gallery or of a single watch, and write the page. Output that ends with
+    PNG_EXT gets an image, others get html."""
+    if output.endswith(PNG_EXT):
+        parse = partial(rasterize_file, size=size)
+        get_gallery_ = partial(get_atlas_gallery, size=size)
+        get_single = lambda image: get_atlas([image], 1, size)
+        return OutFormat(parse, get_gallery_, get_single, write_image)
+    parse = partial(parse_file, instancing=instancing, precision=precision,
+                    outlines=outlines)
+    get_single = lambda svg: [] if svg is None else [get_single_watch(svg)]
+    return OutFormat(parse, get_gallery, get_single, write_index)
+
+
+def write_index(parts, output):
+    """Parts are strings that get written as soon as they are produced. If
+    output is '-' they get written to stdout, else into a temporary file that
+    replaces the output when done, so it never contains a partial page. Output
+    that ends with '.gz' gets compressed."""
+    if output == '-':
+        write_parts(sys.stdout, parts)
+        return
+    tmp_output = f'{output}.tmp'
+    open_ = gzip.open if output.endswith('.gz') else open
+    with open_(tmp_output, 'wt', encoding='utf-8') as file:
+        write_parts(file, parts)
+    os.replace(tmp_output, output)
+
+
+def write_parts(file, parts):
+    """Fonts get written after the parts, so they only contain the
+    characters that the parts used."""
+    used = {}
+    file.write(f'{HEAD} ')
+    for part in parts:
+        add_used_chars(used, part)
+        file.write(part)
+    file.write(f' {get_fonts_style(used)}{TAIL}')
+
+
+def write_image(image, output):
+    """Writes image as PNG. If output is '-' it gets written to stdout."""
+    png = get_png(image)
+    if output == '-':
+        sys.stdout.buffer.write(png)
+        return
+    tmp_output = f'{output}.tmp'
+    with open(tmp_output, 'wb') as file:
+        file.write(png)
+    os.replace(tmp_output, output)
 
 
-def get_head():
-    fonts_defs = [get_font_def(a) for a in FONTS_ALIASES]
-    fonts_css = '\n'.join(fonts_defs)
-    return f'{HEAD}\n<style type="text/css">\n{fonts_css}\n</style>'
+def get_fonts_style(used):
+    return f'<style type="text/css">\n{get_font_defs(used)}\n</style>'
+
+
+def write_report(report):
+    """Writes report of the profiler as JSON. If report is '-' it gets
+    written to stderr."""
+    text = json.dumps(get_report(), indent=2)
+    if report == '-':
+        print(text, file=sys.stderr)
+        return
+    with open(report, 'w', encoding='utf-8') as file:
+        file.write(text + '\n')
 
 
-def parse_single_watch(filename):
-    svg = parse_file(filename)
+def get_single_watch(svg):
     return f'<svg height=300px width=300px>\n<g transform=' \
            f'"translate(150, 150), scale({BASE})")>{svg}</g></svg>\n'
 
 
-def parse_all_watches(directory, max_lines=None):
+def parse_all_watches(directory, max_lines, jobs, out_format, failed=None):
+    """Returns page of the gallery. Html page is a generator of parts, that
+    parses the watches as it goes. Paths of watches that failed to parse get
+    appended to failed."""
+    paths = get_watch_paths(directory)
+    results = parse_files(paths, jobs, out_format.parse, failed)
+    return out_format.get_gallery(results, len(paths), max_lines)
+
+
+def get_watch_paths(directory):
+    filenames = sorted(os.listdir(directory))
+    return [f'{directory}/{a}' for a in filenames if '.txt' in a]
+
+
+def get_gallery(svgs, no_watches, max_lines=None):
+    """Generator of parts of the gallery. Svgs can be an iterator. Svgs of
+    watches that failed to parse are None and leave an empty spot in the
+    grid."""
+    no_columns = get_no_columns(no_watches, max_lines)
+    positions = get_positions(no_watches, no_columns)
+    width = no_columns * ALL_WIDTH
+    yield f'<svg height={width}px width={width}px>\n<g transform=' \
+          f'"translate(150, 150), scale({BASE})")>'
+    separator = ''
+    for svg, (x, y) in zip(svgs, positions):
+        if svg is None:
+            continue
+        yield separator + get_watch_relative(svg, x, y)
+        separator = '\n'
+    yield '</g></svg>\n'
+
+
+def get_no_columns(no_watches, max_lines):
+    if not max_lines:
+        return ceil(sqrt(no_watches))
+    return ceil(no_watches / max_lines)
+
+
+def get_positions(no_watches, no_columns):
     out = []
-    filenames = os.listdir(directory)
-    filenames = [a for a in filenames if '.txt' in a]
-    no_watches = len(filenames)
-    no_columns = ceil(sqrt(no_watches)) if not max_lines else \
-        ceil(no_watches / max_lines)
     x, y = 0, 0
-    for i, filename in enumerate(filenames, 1):
-        svg = get_watch_relative(directory, filename, x, y)
-        out.append(svg)
+    for i in range(1, no_watches+1):
+        out.append((x, y))
         x += ALL_WIDTH
         if i % no_columns == 0:
             x = 0
             y += ALL_WIDTH
-    out = '\n'.join(out)
-    width = no_columns * ALL_WIDTH
-    return f'<svg height={width}px width={width}px>\n<g transform=' \
-           f'"translate(150, 150), scale({BASE})")>{out}</g></svg>\n'
+    return out
 
 
-def get_watch_relative(directory, filename, x, y):
-    path = f'{directory}/{filename}'
-    svg = parse_file(path)
+def get_watch_relative(svg, x, y):
     return f'<g transform="translate({x}, {y})">{svg}</g>'
 
 
-def parse_file(path):
+def get_atlas_gallery(images, no_watches, max_lines, size):
+    """Returns image with thumbnails of watches arranged like in the html
+    gallery. Images can be an iterator."""
+    no_columns = get_no_columns(no_watches, max_lines)
+    return get_atlas(images, no_columns, size)
+
+
+def parse_files(paths, jobs, parse, failed=None):
+    """Generator of svgs in the order of paths. If jobs is larger than one,
+    files get parsed in a pool of processes, with at most FILES_AHEAD_PER_JOB
+    files per job submitted ahead of the one that is being yielded. Failures
+    are reported, their svgs are None and their paths get appended to
+    failed."""
+    if jobs <= 1:
+        for path in paths:
+            yield get_result(partial(parse, path), path, failed)
+        return
+    with ProcessPoolExecutor(max_workers=jobs) as executor:
+        pending = deque()
+        for path in paths:
+            pending.append((path, executor.submit(parse, path)))
+            if len(pending) > jobs * FILES_AHEAD_PER_JOB:
+                yield get_next_result(pending, failed)
+        while pending:
+            yield get_next_result(pending, failed)
+
+
+def get_next_result(pending, failed):
+    """Pending is a deque of paths and futures of their svgs."""
+    path, future = pending.popleft()
+    return get_result(future.result, path, failed)
+
+
+def get_result(get_svg, path, failed):
+    """Failure gets reported with the traceback, which includes the one from
+    the worker process if the svg was parsed in a pool."""
+    try:
+        return get_svg()
+    except Exception:
+        print(f'Failed to parse "{path}":', file=sys.stderr)
+        traceback.print_exc()
+        if failed is not None:
+            failed.append(path)
+
+
+###
+##  WATCH MODE
+#
+
+def watch_files(get_paths, get_page, jobs, output, out_format):
+    """Keeps rewriting the output until interrupted. Only files that changed
+    since the last pass get parsed again, while results of the others are
+    taken from the cache. Change of fonts makes them get read again and all
+    files get parsed again, since their outlines and rasters depend on
+    fonts."""
+    mtimes, svgs = {}, {}
+    fonts_mtimes = None
+    print('Watching for changes, press Ctrl-C to stop.', file=sys.stderr)
+    try:
+        while True:
+            paths = get_paths()
+            new_mtimes = {a: get_mtime(a) for a in paths}
+            new_fonts_mtimes = get_mtimes(FONTS_FOLDER)
+            changed = [a for a in paths if new_mtimes[a] != mtimes.get(a)]
+            if new_fonts_mtimes != fonts_mtimes:
+                clear_fonts()
+                changed = paths
+            if changed or new_mtimes.keys() != mtimes.keys() or \
+                    new_fonts_mtimes != fonts_mtimes:
+                update_svgs(svgs, changed, new_mtimes, jobs, out_format.parse)
+                page = get_page([svgs[a] for a in paths])
+                out_format.write(page, output)
+                mtimes, fonts_mtimes = new_mtimes, new_fonts_mtimes
+            sleep(POLL_INTERVAL)
+    except KeyboardInterrupt:
+        pass
+
+
+def update_svgs(svgs, paths, mtimes, jobs, parse):
+    existing = [a for a in paths if mtimes[a] is not None]
+    for path in paths:
+        svgs[path] = None
+    new_svgs = parse_files(existing, jobs, parse)
+    for path, svg in zip(existing, new_svgs):
+        svgs[path] = svg
+
+
+def get_mtimes(directory):
+    if not os.path.isdir(directory):
+        return {}
+    return {a: get_mtime(f'{directory}/{a}') for a in os.listdir(directory)}
+
+
+def get_mtime(path):
+    try:
+        return os.stat(path).st_mtime_ns
+    except FileNotFoundError:
+        return None
+
+
+###
+##  PARSE FILE
+#
+
+def parse_file(path, instancing=False, precision=None, outlines=False):
+    watch_str = get_watch_str(path)
+    print(f'Parsing "{path}".', file=sys.stderr)
+    watch = get_bundled_model(watch_str, BUNDLES_DIR)
+    return get_watch(watch, instancing=instancing, precision=precision,
+                     outlines=outlines)
+
+
+def rasterize_file(path, size):
     watch_str = get_watch_str(path)
-    print(f'Parsing "{path}".')
-    return get_watch(watch_str)
+    print(f'Rasterizing "{path}".', file=sys.stderr)
+    return get_thumbnail(watch_str, size)
 
 
 def get_watch_str(path):
     if not os.path.isfile(path):
-        print(f'File "{path}" does not exist.', file=sys.stderr)
-        sys.exit(2)
+        raise FileNotFoundError(f'File "{path}" does not exist.')
     return ''.join(read_file(path))
 
 
@@ -113,25 +381,27 @@ def get_watch_str(path):
 ##  GET WATCH
 #
 
-def get_watch(watch_str, r_factor=1):
-    variables, bezel, face = get_parts(watch_str)
-    if RADIUS_KEY in variables:
-        radius = variables[RADIUS_KEY]
-        r_factor = 100 / radius
-    elif DIAMETER_KEY in variables:
-        diameter = variables[DIAMETER_KEY]
-        r_factor = 200 / diameter
-    variables[UNIT_KEY] = 1 / r_factor
-    bezel, face = sub_variables(variables, bezel, face)
-    set_negative_height(bezel)
-    bezel_parts = get_part_svg(bezel, r_factor)
-    bezel_height = 100
-    if bezel_parts:
-        bezel_svg, bezel_height = bezel_parts
-    else:
-        bezel_svg = bezel_parts
-    face_svg, _ = get_part_svg(face, r_factor)
-    svg = ''.join(bezel_svg + face_svg)
+def get_watch(watch, r_factor=1, instancing=False, precision=None,
+              outlines=False):
+    """Watch is either a string with watch definition, a WatchDef or a Watch
+    model that was built with the same r_factor. If precision is set, numbers
+    get rounded to that many decimal places. If outlines is set, texts get
+    drawn as outlines of glyphs."""
+    defs = {}
+    svg = get_watch_svg(watch, r_factor, defs, instancing, outlines)
+    svg = get_defs(defs) + svg
+    if precision is None:
+        return svg
+    return round_numbers(svg, precision)
+
+
+def get_watch_svg(watch, r_factor, defs, instancing=False, outlines=False):
+    """Symbols that are used by the watch get added to defs."""
+    if not isinstance(watch, Watch):
+        watch = get_watch_model(get_watch_def(watch), r_factor)
+    layout = get_layout(watch)
+    svg = emit_svg(layout.display_list, layout.r_factor, defs, instancing,
+                   outlines=outlines)
 
     # Move the background here (from get_subface)
     # bckg = f'<circle cx={p.x} cy={p.y} r={size/2+VER_BORDER} ' \
@@ -139,51 +409,7 @@ def get_watch(watch_str, r_factor=1):
     # return f'{bckg}<g transform="translate({p.x}, {p.y}), scale({scale})">' \
     #        f'{svg}</g>'
 
-    return scale_svg(svg, bezel_height)
-
-
-def get_parts(watch_str):
-    parts = ast.literal_eval(watch_str)
-    dictionary = {}
-    bezel = None
-    if isinstance(parts[0], dict):
-        if len(parts) == 3:
-            dictionary, bezel, elements = parts
-        else:
-            dictionary, elements = parts
-    else:
-        if len(parts) == 2:
-            bezel, elements = parts
-        else:
-            elements = parts[0]
-    return dictionary, bezel, elements
-
-
-def sub_variables(variables, bezel, face):
-    # Double pass:
-    variables = var_pass(variables)
-    variables = var_pass(variables)
-    bezel = replace_matched_items(bezel, variables)
-    face = replace_matched_items(face, variables)
-    return bezel, face
-
-
-def var_pass(variables):
-    keys = variables.keys()
-    values = replace_matched_items(variables.values(), variables)
-    return dict(zip(keys, values))
-
-
-def set_negative_height(elements):
-    if not elements:
-        return
-    for el in elements:
-        el[0] = -el[0]
-        for e in el[1:]:
-            if len(e) < 3:
-                pass
-            args = e[2]
-            args[0] = -args[0]
+    return scale_svg(svg, layout.bezel_height)
 
 
 def scale_svg(svg, bezel_height):
@@ -194,230 +420,206 @@ def scale_svg(svg, bezel_height):
 
 
 ###
-##  GET PART (Bezel/face)
+##  EMIT SVG
 #
 
-def get_part_svg(elements, r_factor):
-    """Part is either face or bezel."""
-    if not elements:
-        return []
+def emit_svg(display_list, r_factor, defs, instancing=False, select=None,
+             outlines=False):
+    """Runs of objects that only differ in angle get rendered with a single
+    call if their shape has a batch renderer. If instancing is set, they get
+    rendered once into a symbol that is added to defs, and then used at each
+    angle. If select is set, only runs of subgroups that it accepts get
+    rendered. If outlines is set, texts get drawn as outlines of glyphs by
+    shapes that have an outlines renderer."""
     out = []
-    radii = get_radii(elements, r_factor)
-    ranges = []
-    max_height = 0
-    for r, element in zip(reversed(radii), reversed(elements)):
-        group, height = get_group(r, element[1:], ranges, r_factor)
-        out.extend(group)
-        if height > max_height:
-            max_height = height
-    out.reverse()
-    return out, max_height
-
-
-def get_radii(elements, r_factor):
+    for start, end in display_list.get_runs():
+        if select and not select(display_list.get_subgroup(start)):
+            continue
+        out.extend(emit_run(display_list, start, end, r_factor, defs,
+                            instancing, outlines))
+    return ''.join(out)
+
+
+def emit_run(display_list, start, end, r_factor, defs, instancing, outlines):
+    """Returns list of svg elements of the run of objects from start to end.
+    Renderer of the run gets looked up and validated once."""
+    count('objects_emitted', end - start)
+    prms = display_list.get_prms(start)
+    if prms.shape == Shape.face:
+        return [get_subface(display_list.get_prms(i), r_factor, defs,
+                            instancing, outlines) for i in range(start, end)]
+    subgroup = display_list.get_subgroup(start)
+    renderer = get_renderer(prms, subgroup.dbg_context)
+    rads = display_list.fi[start:end]
+    if outlines and renderer.render_outlines:
+        return [renderer.render_outlines(prms._replace(fi=fi), defs)
+                for fi in rads]
+    if instancing and renderer.instanced and end - start > 1:
+        symbol_id, symbol, uses = get_instances(renderer, prms, rads)
+        defs[symbol_id] = symbol
+        return uses
+    if renderer.render_batch:
+        return renderer.render_batch(prms.r, rads, prms.args, prms.color)
     out = []
-    r = 100
-    offsets = [a[0]*r_factor for a in elements]
-    for offset in offsets:
-        r -= offset
-        out.append(r)
+    for fi in rads:
+        obj_prms = prms._replace(fi=fi)
+        if renderer.get_defs:
+            defs.update(renderer.get_defs(obj_prms))
+        out.append(renderer.render(obj_prms))
     return out
 
 
-def get_group(r, group, ranges, r_factor):
-    """Group consists of subgroups with same radius."""
-    if not group:
-        return
-    out = []
-    max_height = 0
-    ranges.append(GrpRanges(r, []))
-    curr_ranges = []
-    for subgroup in group:
-        elements, height = get_subgroup(r, subgroup, ranges, curr_ranges,
-                                        r_factor)
-        out.extend(elements)
-        if height > max_height:
-            max_height = height
-    return out, max_height
-
-
-###
-##  GET SUBGROUP (Objects with same shape and radius)
-#
-
-def get_subgroup(r, subgroup, ranges, curr_ranges, r_factor):
-    """Subgroup consists of objects with same properties except for fi."""
-    pos, shape_name, args, offset, color = \
-        add_defaults(subgroup, [None, None, None, 0, 'black'])
-    offset *= r_factor
-    shape_name, fixed, centered = parse_shape(shape_name)
-    shape = get_enum(Shape, shape_name, subgroup)
-    update_lengths(shape, args, r_factor)
-    fii = get_fii(pos)
-    if centered:
-        offset -= shape.get_height(args) / 2
-    r -= offset
-    prmii = (ObjParams(shape, r, fi, list(args), color) for fi in fii)
-    return get_objects(ranges, curr_ranges, prmii, fixed, subgroup, r_factor)
-
-
-def get_no_el(subgroup):
-    no_el = len(subgroup)
-    if no_el < 3 or no_el > 5:
-        msg = f'Number of elements in subgroup "{subgroup}" is {no_el}, but ' \
-            'it should be between 3 and 5.'
-        raise ValueError(msg)
-    return no_el
-
-
-def parse_shape(shape_name):
-    fixed = 'fixed' in shape_name
-    centered = 'centered' in shape_name
-    shape_name = shape_name.split()[0]
-    return shape_name, fixed, centered
-
-
-def update_lengths(shape, args, r_factor):
-    no_size_args = shape.value.no_size_args
-    for i in range(no_size_args):
-        args[i] = args[i] * r_factor
+def get_subface(prms, r_factor, defs, instancing, outlines):
+    """Subface gets rendered into a symbol that is added to defs.
+    prms = ObjParams(shape, r, fi, args, color)"""
+    size, watch_def = prms.args[:2]
+    r_factor_sub = 1 if r_factor == 1 else 200/(size/r_factor)
+    symbol_id, symbols = get_subface_symbols(watch_def, r_factor_sub,
+                                             instancing, outlines)
+    defs.update(symbols)
+    p = get_point(prms.fi, prms.r - size/2)
+    scale = size / 200
+    fill_color = 'black' if INVERT_COLOR else 'white'
+    bckg = f'<circle cx={p.x} cy={p.y} r={size/2+VER_BORDER} ' \
+        f'style="stroke-width:0; fill: {fill_color};"></circle>'
+    return f'{bckg}<use xlink:href="#{symbol_id}" transform="translate(' \
+        f'{p.x}, {p.y}), scale({scale})"/>'
+
+
+@lru_cache(maxsize=SUBFACES_CACHE_SIZE)
+def get_subface_symbols(watch_def, r_factor, instancing, outlines):
+    """Returns id of the symbol with rendered subface and a dictionary with
+    symbols of the subface and of its subfaces. Dictionary is shared between
+    the calls and must not be modified."""
+    count('subfaces_rendered')
+    symbols = {}
+    svg = get_watch_svg(watch_def, r_factor, symbols, instancing, outlines)
+    symbol_id = f'face_{get_hash(f"{watch_def.key} {r_factor}")}'
+    symbols[symbol_id] = f'<symbol id="{symbol_id}" overflow="visible">' \
+        f'{svg}</symbol>'
+    return symbol_id, symbols
+
+
+def get_defs(defs):
+    if not defs:
+        return ''
+    return f'<defs>{"".join(defs.values())}</defs>'
 
 
 ###
-##  GET OBJECTS
+##  FRAMES
 #
 
-def get_objects(ranges, curr_ranges, prmii, fixed, dbg_context, r_factor):
+def get_frames(watch, frames, r_factor=1, instancing=False, precision=None,
+               outlines=False):
+    """Generator of svgs of the watch, one for each of the frames. Frames are
+    dictionaries with values of variables that override the ones of the
+    watch. Subgroups that don't depend on any of these variables form a
+    static layer that only gets emitted again if the layout of the frame
+    moved any of its objects. Subgroups that do get emitted for each frame
+    and drawn over it."""
+    watch_def = get_watch_def(watch)
+    names = get_dynamic_names(watch_def.variables, frames)
+    round_ = lambda svg: svg if precision is None else \
+        round_numbers(svg, precision)
+    static, static_defs, static_key = None, {}, None
+    for frame in frames:
+        frame_def = watch_def._replace(
+            variables={**watch_def.variables, **frame},
+            key=get_hash(f'{watch_def.key} {get_repr(frame)}'))
+        watch = get_watch_model(frame_def, r_factor)
+        dynamic_ids = get_dynamic_subgroups(watch_def, watch, names)
+        is_dynamic = lambda subgroup: id(subgroup) in dynamic_ids
+        is_static = lambda subgroup: id(subgroup) not in dynamic_ids
+        layout = get_layout(watch)
+        key = get_layer_key(layout.display_list, is_static)
+        if key != static_key:
+            count('static_layers_emitted')
+            static_defs = {}
+            static = round_(emit_svg(layout.display_list, layout.r_factor,
+                                     static_defs, instancing, is_static,
+                                     outlines))
+            static_key = key
+        defs = dict(static_defs)
+        dynamic = emit_svg(layout.display_list, layout.r_factor, defs,
+                           instancing, is_dynamic, outlines)
+        head, tail = scale_svg('\0', layout.bezel_height).split('\0')
+        yield f'{round_(get_defs(defs) + head)}{static}{round_(dynamic)}' \
+            f'{tail}'
+
+
+def get_layer_key(display_list, select):
+    """Returns properties of runs of objects of subgroups that select
+    accepts. Layers with equal keys get rendered the same."""
     out = []
-    height = 0
-    for prms in prmii:
-        check_args(prms, dbg_context)
-        obj = get_object(ranges, curr_ranges, prms, fixed, dbg_context,
-                         r_factor)
-        if not obj:
-            continue
-        out.append(obj)
-        if height == 0:
-            height = get_height(prms) + prms.r
-    return out, height
-
-
-def get_object(ranges, curr_ranges, prms, fixed, dbg_context, r_factor):
-    """prms = ObjParams(shape, r, fi, args, color)"""
-    if prms.shape in [Shape.border, Shape.shifted_border]:
-        return get_svg_el(prms, dbg_context, r_factor)
-    if not fixed:
-        fix_height(ranges, prms)
-    if range_occupied(curr_ranges, prms):
-        return None
-    update_ranges(ranges, curr_ranges, prms)
-    return get_svg_el(prms, dbg_context, r_factor)
-
-
-###
-##  FIX HEIGHT
-#
-
-def fix_height(ranges, prms):
-    """prms = ObjParams(shape, r, fi, args, color)"""
-    height = get_height(prms)
-    max_height = get_max_height(ranges, prms)
-    if abs(height) > abs(max_height):
-        update_height(prms.shape, prms.args, max_height)
-
-
-def get_max_height(all_ranges, prms):
-    """prms = ObjParams(shape, r, fi, args, color)"""
-    if len(all_ranges) <= 1:
-        return 100
-    for grp_ranges in reversed(all_ranges[:-1]):
-        r, ranges = grp_ranges
-        width = get_angular_width(prms.shape, prms.args, r)
-        if pos_occupied(prms.fi, width, ranges):
-            return calculate_max_height(prms, r)
-    return 100
-
-
-def calculate_max_height(prms, r):
-    """prms = ObjParams(shape, r, fi, args, color)"""
-    out = prms.r - r
-    height = get_height(prms)
-    border = VER_BORDER if height < 0 else -VER_BORDER
-    max_height = out + border
-    if height > 0 >= max_height:
-        return 0
-    if height < 0 <= max_height:
-        return 0
-    return max_height
-
-
-def update_height(shape, args, height):
-    if shape == Shape.triangle:
-        height_old, width_old = args
-        factor = height / height_old
-        width = width_old * factor
-        args[0], args[1] = height, width
-    else:
-        args[0] = height
-
+    for start, end in display_list.get_runs():
+        if select(display_list.get_subgroup(start)):
+            prms = display_list.get_prms(start)
+            out.append((prms.shape, prms.r, prms.args, prms.color,
+                        display_list.fi[start:end]))
+    return out
 
-###
-##  GET SVG EL
-#
 
-def get_svg_el(prms, dbg_context, r_factor):
-    """prms = ObjParams(shape, r, fi, args, color)"""
-    height = get_height(prms)
-    if height == 0:
-        return ''
-    if height < 0:
-        prms = transpose_el_with_neg_height(prms)
-    rad = get_rad(prms.fi)
-    prms_rad = ObjParams(prms.shape, prms.r, rad, prms.args, prms.color)
-    if prms.shape != Shape.face:
-        if INVERT_COLOR:
-            prms_rad = invert_color(prms_rad)
-        return get_shape(prms_rad, dbg_context)
-    return get_subface(prms_rad, r_factor)
-
-
-def invert_color(prms):
-    new_color = prms.color
-    if prms.color in ('black', 'white', ''):
-        new_color = 'black' if prms.color == 'white' else 'white'
-    return ObjParams(prms.shape, prms.r, prms.fi, prms.args, new_color)
-
-
-def transpose_el_with_neg_height(prms):
-    """prms = ObjParams(shape, r, fi, args, color)"""
-    height = get_height(prms)
-    args = prms.args
-    args[0] = -args[0]
-    return ObjParams(prms.shape, prms.r - height, prms.fi, args, prms.color)
-
-
-def get_subface(prms, r_factor):
-    """prms = ObjParams(shape, r, fi, args, color)"""
-    face_str = str(prms.args[1])
-    size = prms.args[0]
-    r_factor_sub = 1 if r_factor == 1 else 200/(size/r_factor)
-    svg = get_watch(face_str, r_factor_sub)
-    p = get_point(prms.fi, prms.r - size/2)
-    scale = size / 200
-    fill_color = 'black' if INVERT_COLOR else 'white'
-    bckg = f'<circle cx={p.x} cy={p.y} r={size/2+VER_BORDER} ' \
-        f'style="stroke-width:0; fill: {fill_color};"></circle>'
-    return f'{bckg}<g transform="translate({p.x}, {p.y}), scale({scale})">' \
-        f'{svg}</g>'
+def get_dynamic_names(variables, frames):
+    """Returns names of variables that are set by any of the frames, and of
+    the variables that depend on them."""
+    out = set().union(*frames)
+    while True:
+        dependent = {k for k, v in variables.items() if k not in out and
+                     not get_names([v]).isdisjoint(out)}
+        if not dependent:
+            return out
+        out |= dependent
+
+
+def get_dynamic_subgroups(watch_def, watch, names):
+    """Returns ids of subgroups of the Watch model whose definitions, or
+    definitions of their groups, use any of the names."""
+    everything = not names.isdisjoint({RADIUS_KEY, DIAMETER_KEY})
+    out = set()
+    for elements, groups in ((watch_def.bezel, watch.bezel),
+                             (watch_def.face, watch.face)):
+        for element, group in zip(elements or (), groups):
+            dynamic_group = everything or \
+                not get_names(element[:1]).isdisjoint(names)
+            for subgroup_def, subgroup in zip(element[1:], group.subgroups):
+                if dynamic_group or \
+                        not get_names(subgroup_def).isdisjoint(names):
+                    out.add(id(subgroup))
+    return out
 
 
 ###
-##  UTIL
+##  PROFILE
 #
 
-def get_height(prms):
-    """prms = ObjParams(shape, r, fi, args, color)"""
-    return prms.shape.get_height(prms.args)
+def get_profiled_stages():
+    """Returns module name, function name and name of the stage of each of
+    the functions that get timed when profiling. Emission of runs gets timed
+    separately for each shape."""
+    return (
+        (__name__, 'get_watch_def', 'parse'),
+        ('src.bundle', 'get_watch_def', 'parse'),
+        ('src.model', 'get_parts', 'get_parts'),
+        (__name__, 'get_watch_model', 'model'),
+        ('src.bundle', 'get_watch_model', 'model'),
+        ('src.bundle', 'load_bundle', 'load_bundle'),
+        ('src.bundle', 'save_bundle', 'save_bundle'),
+        ('src.model', 'sub_variables', 'sub_variables'),
+        (__name__, 'get_layout', 'layout'),
+        ('src.layout', 'get_part_layout', 'layout_part'),
+        ('src.layout', 'fix_height', 'fix_height'),
+        ('src.layout', 'range_occupied', 'range_occupied'),
+        ('src.layout', 'ranges_occupied', 'range_occupied'),
+        (__name__, 'emit_svg', 'emit'),
+        (__name__, 'emit_run', get_run_stage),
+        (__name__, 'get_subface_symbols', 'subface'),
+        (__name__, 'round_numbers', 'round_numbers')
+    )
+
+
+def get_run_stage(display_list, start, *_):
+    return f'emit_{display_list.get_prms(start).shape.name}'
 
 
 if __name__ == '__main__':
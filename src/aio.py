@@ -0,0 +1,84 @@
+import asyncio
+import os
+from collections import namedtuple
+from concurrent.futures import ProcessPoolExecutor
+
+from src.util import read_file, write_to_file
+
+
+Result = namedtuple('Result', ['index', 'watch', 'svg', 'error'])
+
+
+###
+##  RENDER MANY
+#
+
+async def render_many(watches, render, concurrency=4, executor=None):
+    """Asynchronous generator of Results in the order in which watches get
+    rendered. Watches are paths of watch files, watch definitions (strings
+    that start with '[') or WatchDefs, and index is their position in the
+    iterable. Render receives watch definition and returns its svg, like
+    'get_watch()' in 'parse.py'. Files are read in the default executor of
+    the loop while at most concurrency watches get rendered in executor,
+    which is a pool of concurrency processes by default. Failed watches yield
+    Results with an error instead of svg. Closing the generator or cancelling
+    the task that iterates over it cancels the watches that were not yet
+    submitted."""
+    own_executor = executor is None
+    if own_executor:
+        executor = ProcessPoolExecutor(max_workers=concurrency)
+    items = enumerate(watches)
+    results = asyncio.Queue(maxsize=concurrency)
+    workers = [asyncio.create_task(render_items(items, render, executor,
+                                                results))
+               for _ in range(concurrency)]
+    try:
+        no_finished = 0
+        while no_finished < len(workers):
+            result = await results.get()
+            if result is None:
+                no_finished += 1
+                continue
+            yield result
+    finally:
+        for worker in workers:
+            worker.cancel()
+        await asyncio.gather(*workers, return_exceptions=True)
+        if own_executor:
+            executor.shutdown(wait=False, cancel_futures=True)
+
+
+async def render_items(items, render, executor, results):
+    """Renders items until the shared iterator is exhausted and then puts
+    None into results."""
+    loop = asyncio.get_running_loop()
+    for index, watch in items:
+        try:
+            watch_def = await read_watch(watch) if is_path(watch) else watch
+            svg = await loop.run_in_executor(executor, render, watch_def)
+        except Exception as e:
+            await results.put(Result(index, watch, None, e))
+        else:
+            await results.put(Result(index, watch, svg, None))
+    await results.put(None)
+
+
+def is_path(watch):
+    if isinstance(watch, os.PathLike):
+        return True
+    return isinstance(watch, str) and not watch.lstrip().startswith('[')
+
+
+###
+##  FILES
+#
+
+async def read_watch(path):
+    loop = asyncio.get_running_loop()
+    lines = await loop.run_in_executor(None, read_file, path)
+    return ''.join(lines)
+
+
+async def write_file(filename, text):
+    loop = asyncio.get_running_loop()
+    await loop.run_in_executor(None, write_to_file, filename, text)
@@ -0,0 +1,88 @@
+import os
+import pickle
+from functools import lru_cache
+
+from src.model import get_watch_def, get_watch_model
+from src.util import get_hash
+
+
+# Modules whose code determines the model, so bundles get invalidated when
+# any of them changes.
+MODEL_MODULES = ('model.py', 'fii.py', 'util.py', 'shape.py')
+BUNDLE_EXT = '.pickle'
+
+
+###
+##  BUNDLE
+#
+
+def get_bundled_model(watch, directory, r_factor=1):
+    """Returns Watch model of the watch definition string. It gets loaded from
+    a bundle in the directory if one with the same source, r_factor and code
+    of the model exists, else it gets created and saved there. Failure to
+    read or write the bundle only costs the time of building the model."""
+    code_key = get_code_key()
+    key = get_hash(f'{r_factor} {watch}')
+    path = os.path.join(directory, f'{code_key}_{key}{BUNDLE_EXT}')
+    model = load_bundle(path)
+    if model is None:
+        model = get_watch_model(get_watch_def(watch), r_factor)
+        if save_bundle(path, model):
+            remove_stale_bundles(directory, code_key)
+    return model
+
+
+def load_bundle(path):
+    """Returns None if the bundle doesn't exist or can't be unpickled, for
+    example because it is corrupt or was saved by a different code."""
+    try:
+        with open(path, 'rb') as file:
+            return pickle.load(file)
+    except Exception:
+        return None
+
+
+def save_bundle(path, model):
+    """Bundle gets written into a temporary file that replaces it when done,
+    so processes that write the same bundle at once don't corrupt it. Returns
+    whether the bundle was saved. Models that can't be pickled, for example
+    ones with lambdas of custom renderers, are not saved."""
+    tmp_path = f'{path}.{os.getpid()}.tmp'
+    try:
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(tmp_path, 'wb') as file:
+            pickle.dump(model, file, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp_path, path)
+        return True
+    except Exception:
+        remove_file(tmp_path)
+        return False
+
+
+def remove_stale_bundles(directory, code_key):
+    """Removes bundles and their temporary files that were saved by a
+    different code of the model."""
+    try:
+        filenames = os.listdir(directory)
+    except OSError:
+        return
+    for filename in filenames:
+        if BUNDLE_EXT in filename and not filename.startswith(f'{code_key}_'):
+            remove_file(os.path.join(directory, filename))
+
+
+def remove_file(path):
+    try:
+        os.remove(path)
+    except OSError:
+        pass
+
+
+@lru_cache(maxsize=None)
+def get_code_key():
+    directory = os.path.dirname(os.path.abspath(__file__))
+    sources = []
+    for filename in MODEL_MODULES:
+        with open(os.path.join(directory, filename), encoding='utf-8') as file:
+            sources.append(file.read())
+    return get_hash('\n'.join(sources))
@@ -0,0 +1,118 @@
+from array import array
+from collections import namedtuple
+
+from src.shape import Shape
+
+
+ObjParams = namedtuple('ObjParams', ['shape', 'r', 'fi', 'args', 'color'])
+
+
+class DisplayList:
+    """Objects of a watch after the layout, in the order they get drawn.
+    Objects are stored as columns of arrays. Shapes are stored as their codes,
+    while arguments, colors and subgroups as indexes into tables of distinct
+    values. Angle fi is in radians, heights are positive and colors final.
+    Whether radius was an integer is also stored, so it gets emitted the same
+    way as before the layout. Emitters (like 'emit_svg()' in 'parse.py') read
+    it through 'get_runs()' and 'get_prms()'."""
+
+    __slots__ = ('shapes', 'r', 'int_r', 'fi', 'args', 'colors', 'subgroups',
+                 'args_table', 'colors_table', 'subgroups_table', 'indexes')
+
+    def __init__(self):
+        self.shapes = array('B')
+        self.r = array('d')
+        self.int_r = array('B')
+        self.fi = array('d')
+        self.args = array('I')
+        self.colors = array('I')
+        self.subgroups = array('I')
+        self.args_table = []
+        self.colors_table = []
+        self.subgroups_table = []
+        self.indexes = {}
+
+    def __len__(self):
+        return len(self.shapes)
+
+    def append(self, prms, subgroup):
+        """prms = ObjParams(shape, r, fi, args, color), subgroup = Subgroup"""
+        self.append_entry(self.get_entry(prms, subgroup), prms.fi)
+
+    def get_entry(self, prms, subgroup):
+        """Returns codes of all properties of the object except for fi, so
+        objects that only differ in fi can be appended without creating their
+        ObjParams.
+        prms = ObjParams(shape, r, fi, args, color), subgroup = Subgroup"""
+        return (prms.shape.code, prms.r, isinstance(prms.r, int),
+                self.get_index(self.args_table, prms.args),
+                self.get_index(self.colors_table, prms.color),
+                self.get_index(self.subgroups_table, subgroup))
+
+    def append_entry(self, entry, fi):
+        shape, r, int_r, args, color, subgroup = entry
+        self.shapes.append(shape)
+        self.r.append(r)
+        self.int_r.append(int_r)
+        self.fi.append(fi)
+        self.args.append(args)
+        self.colors.append(color)
+        self.subgroups.append(subgroup)
+
+    def get_index(self, table, value):
+        """Returns index of the value in the table, adding it if necessary.
+        Values are looked up by identity, since arguments can contain
+        unhashable objects."""
+        key = (id(table), id(value))
+        i = self.indexes.get(key)
+        if i is None:
+            i = len(table)
+            table.append(value)
+            self.indexes[key] = i
+        return i
+
+    def extend(self, other):
+        """Appends objects of the other display list column by column, with
+        indexes into its tables translated into indexes into own tables."""
+        for column, table, other_column, other_table in (
+                (self.args, self.args_table, other.args, other.args_table),
+                (self.colors, self.colors_table, other.colors,
+                 other.colors_table),
+                (self.subgroups, self.subgroups_table, other.subgroups,
+                 other.subgroups_table)):
+            indexes = [self.get_index(table, a) for a in other_table]
+            column.extend(indexes[i] for i in other_column)
+        for column, other_column in ((self.shapes, other.shapes),
+                                     (self.r, other.r),
+                                     (self.int_r, other.int_r),
+                                     (self.fi, other.fi)):
+            column.extend(other_column)
+
+    def reverse(self):
+        for column in (self.shapes, self.r, self.int_r, self.fi, self.args,
+                       self.colors, self.subgroups):
+            column.reverse()
+
+    def get_prms(self, i):
+        r = int(self.r[i]) if self.int_r[i] else self.r[i]
+        return ObjParams(Shape.codes[self.shapes[i]], r, self.fi[i],
+                         self.args_table[self.args[i]],
+                         self.colors_table[self.colors[i]])
+
+    def get_subgroup(self, i):
+        return self.subgroups_table[self.subgroups[i]]
+
+    def get_runs(self):
+        """Yields start and end indexes of runs of consecutive objects that
+        only differ in fi."""
+        start = 0
+        for i in range(1, len(self) + 1):
+            if i == len(self) or not self.same_except_fi(start, i):
+                yield start, i
+                start = i
+
+    def same_except_fi(self, i, j):
+        return self.shapes[i] == self.shapes[j] and self.r[i] == self.r[j] \
+            and self.args[i] == self.args[j] \
+            and self.colors[i] == self.colors[j] \
+            and self.subgroups[i] == self.subgroups[j]
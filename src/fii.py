@@ -1,9 +1,61 @@
-from itertools import chain
 from math import ceil, isclose, log10
 from numbers import Real
 
+from src.util import Cache
+
+
+# Number of decimal places that angles get compared at when removing
+# duplicates.
+PRECISION = 12
+# Number of positions whose angles are kept.
+FII_CACHE_SIZE = 1024
+
+# Angles of the last used positions by keys from 'get_key()'.
+FII_CACHE = Cache(FII_CACHE_SIZE)
+
 
 def get_fii(pos):
+    """Returns tuple of normalized angles of the position, without duplicates,
+    in the order of their first appearance. Results are memoized per
+    position, so equal positions of different subgroups and watches get
+    computed once."""
+    try:
+        key = get_key(pos)
+        out = FII_CACHE.get(key)
+    except TypeError:
+        return get_unique(get_fii_raw(pos))
+    if out is None:
+        out = get_unique(get_fii_raw(pos))
+        FII_CACHE.put(key, out)
+    return out
+
+
+def get_key(pos):
+    """Returns hashable key of the position. Types are a part of the key, so
+    for example 1 and 1.0 get different keys."""
+    if isinstance(pos, set):
+        return set, tuple(sorted(pos))
+    if isinstance(pos, dict):
+        return dict, tuple(sorted((k, get_key(v)) for k, v in pos.items()))
+    if isinstance(pos, list):
+        return list, tuple(get_key(a) for a in pos)
+    return type(pos), pos
+
+
+def get_unique(fii):
+    """Returns tuple of normalized angles without the ones that are equal to
+    an earlier one when rounded to PRECISION decimal places."""
+    out, seen = [], set()
+    for fi in fii:
+        fi = normalize_fi(fi)
+        key = round(fi, PRECISION) % 1
+        if key not in seen:
+            seen.add(key)
+            out.append(fi)
+    return tuple(out)
+
+
+def get_fii_raw(pos):
     if isinstance(pos, set):
         return get_fii_set(pos)
     elif isinstance(pos, Real):
@@ -12,15 +64,13 @@ def get_fii(pos):
         return get_fii_dict(pos)
     elif isinstance(pos, list):
         return get_fii_list(pos)
+    return ()
 
 
 def get_fii_set(nums):
-    out = set()
-    for a in nums:
-        if a < 0:
-            a += 1
-        out.add(a)
-    return out
+    """Positions are sorted, since the iteration order of a set depends on
+    hashing of the strings that they were evaluated from."""
+    return sorted(normalize_fi(a) for a in nums)
 
 
 def get_fii_real(pos):
@@ -48,13 +98,15 @@ def get_fii_dict(pos):
         out = get_log(pos)
     else:
         out = get_fii(pos['pos'])
-    return [normalize_fi(a + offset) for a in out]
+    return [a + offset for a in out]
 
 
 def get_tachy(pos):
     locations = pos['tachy']
     if type(locations) == list:
         locations = list_to_range(locations)
+    elif type(locations) == set:
+        locations = sorted(locations)
     return [(60 / a) for a in locations]
 
 
@@ -62,44 +114,37 @@ def get_log(pos):
     locations = pos['log']
     if type(locations) == list:
         locations = list_to_range(locations)
+    elif type(locations) == set:
+        locations = sorted(locations)
     offset = 1 - log10(6)
     return [(log10(a) - 1 + offset) for a in locations]
 
 
 def list_to_range(a_list):
-    out = parse_sets(a_list)
+    """List consists of sets of locations and of start, end and step of a
+    range, optionally followed by pairs of end and step of the ranges that
+    continue it. Returns list of locations of the sets followed by the
+    locations of the ranges."""
+    out, a_list = parse_sets(a_list)
     a_len = len(a_list)
-    if a_len < 2:
+    if a_len < 2 or (a_len > 3 and a_len % 2 == 0):
         raise ValueError(f'Wrong number of arguments in locations list: '
                          f'{a_list}')
-    if a_len == 2:
-        start, end = a_list
-        return chain(out, range(start, end+1))
-    elif a_len == 3:
-        start, end, step = a_list
-        return chain(out, range(start, end+1, step))
-    elif a_len > 3:
-        start, end, step = a_list[0], a_list[1], a_list[2]
-        out = chain(out, range(start, end+1, step))
-        no_pairs = (a_len - 3) / 2
-        if no_pairs % 1 != 0:
-            raise ValueError(f'Wrong number of arguments in locations list: '
-                             f'{a_list}')
-        for i in range(int(no_pairs)):
-            new_end, step = a_list[3 + 2*i], a_list[4 + 2*i]
-            tmp_range = range(end+step, new_end+1, step)
-            end = new_end
-            out = chain(out, tmp_range)
-        return out
+    start, end = a_list[:2]
+    step = a_list[2] if a_len > 2 else 1
+    out.extend(range(start, end+1, step))
+    for new_end, step in zip(a_list[3::2], a_list[4::2]):
+        out.extend(range(end+step, new_end+1, step))
+        end = new_end
+    return out
 
 
 def parse_sets(a_list):
-    out = []
-    set_indexes = [a_list.index(a) for a in a_list if type(a) == set]
-    for i in set_indexes:
-        a_set = a_list.pop(i)
-        out.extend(a_set)
-    return out
+    """Returns sorted items of the sets in the list and the list without
+    them. The list doesn't get modified."""
+    items = [b for a in a_list if type(a) == set for b in sorted(a)]
+    rest = [a for a in a_list if type(a) != set]
+    return items, rest
 
 
 def get_range(locations):
@@ -109,6 +154,8 @@ def get_range(locations):
 
 
 def get_fii_list(pos):
+    """Bounds get normalized once. Angles between 0 and 1 only need their
+    remainder to be normalized."""
     n = pos[0]
     start = 0
     if len(pos) == 2:
@@ -116,12 +163,13 @@ def get_fii_list(pos):
     else:
         start = pos[1]
         end = pos[2]
-    return [i/n for i in range(n+1) if is_between(i/n, start, end)]
+    start, end = normalize_fi(start), normalize_fi(end)
+    fii = [i/n for i in range(n+1)]
+    return [a for a in fii if is_between(a % 1, start, end)]
 
 
 def is_between(fi, fi_start, fi_end):
-    fi, fi_start, fi_end = normalize_fi(fi), normalize_fi(fi_start), \
-                           normalize_fi(fi_end)
+    """All angles must already be normalized."""
     if isclose(fi, fi_start) or isclose(fi, fi_end):
         return True
     crosses_zero = fi_start > fi_end
@@ -133,10 +181,11 @@ def is_between(fi, fi_start, fi_end):
 
 
 def normalize_fi(fi):
+    """Returns angle between 0 (inclusive) and 1 (exclusive)."""
     # Old and always false:
     # if -1 >= fi >= 1:
     if -1 >= fi or fi >= 1:
         fi %= 1
     if fi < 0:
         fi += 1
-    return fi
+    return 0.0 if fi >= 1 else fi
@@ -1,21 +1,89 @@
+import re
+from base64 import b64encode
+from functools import lru_cache
 from genericpath import isfile
+from html import unescape
+
+from src.ttf import get_contours, get_outline, get_subset, read_font
 
 
 FONTS_FOLDER = 'fonts'
 FONTS_ALIASES = {'lange': 'engraversmtbold', 'lange_thin': 'engr',
                  'patek_date': 'steelfish.regular'}
+# Locations of fonts that browsers provide, but are not in the fonts folder.
+LINUX_FONTS = '/usr/share/fonts/truetype'
+SYSTEM_FONTS = {
+    'arial': [f'{LINUX_FONTS}/liberation/LiberationSans-Regular.ttf',
+              f'{LINUX_FONTS}/dejavu/DejaVuSans.ttf',
+              '/Library/Fonts/Arial.ttf', 'C:/Windows/Fonts/arial.ttf'],
+    'times': [f'{LINUX_FONTS}/liberation/LiberationSerif-Regular.ttf',
+              f'{LINUX_FONTS}/dejavu/DejaVuSerif.ttf',
+              '/Library/Fonts/Times New Roman.ttf',
+              'C:/Windows/Fonts/times.ttf']
+}
+FALLBACK_FONT = 'patek_date'
+# Font and text of elements that get emitted by '_get_text()' and
+# 'get_bent_rotated()' in 'svg.py'.
+TEXT = re.compile(r'font-family="([^"]*)"[^>]*>(?:<textPath[^>]*>)?([^<]*)<')
+
+
+def add_used_chars(used, svg):
+    """Adds characters of the texts in svg to the sets of characters of their
+    fonts in the used dictionary."""
+    for font_name, text in TEXT.findall(svg):
+        used.setdefault(font_name, set()).update(unescape(text))
+
+
+def get_font_defs(used):
+    """Returns css with fonts of the used dictionary that are in the fonts
+    folder. They get embedded with only the glyphs of the used characters."""
+    defs = (get_font_def(name, used[name]) for name in sorted(used))
+    return '\n'.join(a for a in defs if a)
+
+
+def get_font_def(font_name, chars):
+    font_path = get_font_path(font_name)
+    if not font_path:
+        return
+    font = b64encode(get_subset(read_font(font_path), chars)).decode()
+    return '@font-face {' \
+           f'    font-family: "{font_name}";' \
+           f'    src: url(data:font/ttf;base64,{font}) format("truetype");' \
+           '}'
 
 
-def get_font_def(font_name):
+def get_font_path(font_name):
+    """Returns path of the font in the fonts folder or None."""
     font_path = f'{FONTS_FOLDER}/{font_name}.ttf'
     if not isfile(font_path):
         if font_name not in FONTS_ALIASES:
             return
         font_path = f'{FONTS_FOLDER}/{FONTS_ALIASES[font_name]}.ttf'
-    return '@font-face {' \
-           f'    font-family: "{font_name}";' \
-           f'    src: url({font_path}) format("truetype");' \
-           '}' \
-           'p.customfont {' \
-           f'    font-family: "{font_name}", Arial;' \
-           '}'
+    return font_path
+
+
+def get_system_font_path(font_name):
+    """Returns path of the font in the fonts folder, of the installed font
+    with the same name, or of the fallback font."""
+    font_path = get_font_path(font_name)
+    if font_path:
+        return font_path
+    for font_path in SYSTEM_FONTS.get(font_name.lower(), []):
+        if isfile(font_path):
+            return font_path
+    return get_font_path(FALLBACK_FONT)
+
+
+@lru_cache(maxsize=None)
+def get_font(font_name):
+    """Returns Font from 'ttf.py' of the font path from
+    'get_system_font_path()'."""
+    return read_font(get_system_font_path(font_name))
+
+
+def clear_fonts():
+    """Makes fonts get read again from their files, after they changed.
+    Outlines of their glyphs get dropped too, while paths of the glyphs that
+    svg memoizes are keyed by the contents of the font."""
+    for cache in (get_font, read_font, get_outline, get_contours):
+        cache.cache_clear()
@@ -0,0 +1,263 @@
+from collections import namedtuple
+
+from src.display import DisplayList, ObjParams
+from src.ranges import OccupiedRanges, RingIndex, range_occupied, \
+    ranges_occupied, update_ranges, get_angular_width, get_ranges
+from src.shape import Shape
+from src.stats import count
+from src.util import get_rad
+
+
+INVERT_COLOR = False
+
+VER_BORDER = 2
+BORDERS = (Shape.border, Shape.shifted_border)
+
+Layout = namedtuple('Layout', ['display_list', 'bezel_height', 'r_factor'])
+
+
+###
+##  GET LAYOUT
+#
+
+def get_layout(watch):
+    """Returns Layout with display list of objects of the bezel followed by
+    the objects of the face. Watch is the model from 'get_watch_model()'."""
+    bezel_parts = get_part_layout(watch.bezel)
+    bezel_height = 100
+    if bezel_parts:
+        display_list, bezel_height = bezel_parts
+    else:
+        display_list = DisplayList()
+    face_parts = get_part_layout(watch.face)
+    if face_parts:
+        display_list.extend(face_parts[0])
+    return Layout(display_list, bezel_height, watch.r_factor)
+
+
+###
+##  GET PART (Bezel/face)
+#
+
+def get_part_layout(groups):
+    """Part is either face or bezel."""
+    if not groups:
+        return []
+    out = DisplayList()
+    radii = get_radii(groups)
+    ranges = RingIndex()
+    max_height = 0
+    for r, group in zip(reversed(radii), reversed(groups)):
+        height = get_group(r, group.subgroups, ranges, out)
+        if height > max_height:
+            max_height = height
+    out.reverse()
+    return out, max_height
+
+
+def get_radii(groups):
+    out = []
+    r = 100
+    for group in groups:
+        r -= group.offset
+        out.append(r)
+    return out
+
+
+def get_group(r, subgroups, ranges, out):
+    """Group consists of subgroups with same radius."""
+    if not subgroups:
+        return
+    max_height = 0
+    ranges.add_ring(r)
+    curr_ranges = OccupiedRanges()
+    for subgroup in subgroups:
+        height = get_subgroup(r, subgroup, ranges, curr_ranges, out)
+        if height > max_height:
+            max_height = height
+    return max_height
+
+
+###
+##  GET SUBGROUP (Objects with same shape and radius)
+#
+
+def get_subgroup(r, subgroup, ranges, curr_ranges, out):
+    """Subgroup consists of objects with same properties except for fi."""
+    shape, args, color = subgroup.shape, subgroup.args, subgroup.color
+    r -= subgroup.offset
+    count('objects_generated', len(subgroup.fii))
+    if shape not in BORDERS and shape.get_height(args) != 0:
+        prms = ObjParams(shape, r, None, args, color)
+        return get_batch(ranges, curr_ranges, prms, subgroup, out)
+    prmii = (ObjParams(shape, r, fi, args, color) for fi in subgroup.fii)
+    return get_objects(ranges, curr_ranges, prmii, subgroup, out)
+
+
+###
+##  GET OBJECTS
+#
+
+def get_objects(ranges, curr_ranges, prmii, subgroup, out):
+    height = 0
+    for prms in prmii:
+        if not subgroup.fixed and prms.shape not in BORDERS:
+            prms = fix_height(ranges, prms)
+        if not add_object(ranges, curr_ranges, prms, subgroup, out):
+            continue
+        if height == 0:
+            height = abs(get_height(prms)) + prms.r
+    return height
+
+
+def add_object(ranges, curr_ranges, prms, subgroup, out):
+    """Returns whether object was added to the display list.
+    prms = ObjParams(shape, r, fi, args, color)"""
+    if prms.shape in BORDERS:
+        return add_item(prms, subgroup, out)
+    if range_occupied(curr_ranges, prms):
+        count('objects_dropped_by_collision')
+        return False
+    update_ranges(ranges, curr_ranges, prms)
+    return add_item(prms, subgroup, out)
+
+
+###
+##  GET BATCH
+#
+
+def get_batch(ranges, curr_ranges, prms, subgroup, out):
+    """Lays out objects that share shape, radius and arguments, so their width
+    and height only get computed once. Objects whose height needs to be fixed
+    are processed one by one.
+    prms = ObjParams(shape, r, None, args, color)"""
+    width = get_angular_width(prms.shape, prms.args, prms.r)
+    entry = out.get_entry(get_item(prms), subgroup)
+    height = 0
+    for fi in subgroup.fii:
+        if not subgroup.fixed and needs_fixing(ranges, prms, fi):
+            obj_prms = fix_height(ranges, prms._replace(fi=fi))
+            if not add_object(ranges, curr_ranges, obj_prms, subgroup, out):
+                continue
+            if height == 0:
+                height = abs(get_height(obj_prms)) + obj_prms.r
+            continue
+        obj_ranges = get_ranges(fi, width)
+        if ranges_occupied(curr_ranges, obj_ranges):
+            count('objects_dropped_by_collision')
+            continue
+        curr_ranges.add(obj_ranges)
+        ranges.get_ring(prms.r).add(obj_ranges)
+        out.append_entry(entry, get_rad(fi))
+        if height == 0:
+            height = abs(get_height(prms)) + prms.r
+    return height
+
+
+def needs_fixing(ranges, prms, fi):
+    """prms = ObjParams(shape, r, None, args, color)"""
+    height = get_height(prms)
+    max_height = get_max_height_at(ranges, prms, fi)
+    return abs(height) > abs(max_height)
+
+
+###
+##  FIX HEIGHT
+#
+
+def fix_height(ranges, prms):
+    """Returns prms with height reduced to the space that is available.
+    prms = ObjParams(shape, r, fi, args, color)"""
+    height = get_height(prms)
+    max_height = get_max_height(ranges, prms)
+    if abs(height) > abs(max_height):
+        count('heights_clamped')
+        args = update_height(prms.shape, prms.args, max_height)
+        return prms._replace(args=args)
+    return prms
+
+
+def get_max_height(ranges, prms):
+    """prms = ObjParams(shape, r, fi, args, color)"""
+    return get_max_height_at(ranges, prms, prms.fi)
+
+
+def get_max_height_at(ranges, prms, fi):
+    """prms = ObjParams(shape, r, fi, args, color)"""
+    r = ranges.get_inner_radius(fi, prms.shape, prms.args)
+    if r is None:
+        return 100
+    return calculate_max_height(prms, r)
+
+
+def calculate_max_height(prms, r):
+    """prms = ObjParams(shape, r, fi, args, color)"""
+    out = prms.r - r
+    height = get_height(prms)
+    border = VER_BORDER if height < 0 else -VER_BORDER
+    max_height = out + border
+    if height > 0 >= max_height:
+        return 0
+    if height < 0 <= max_height:
+        return 0
+    return max_height
+
+
+def update_height(shape, args, height):
+    if shape == Shape.triangle:
+        height_old, width_old = args
+        factor = height / height_old
+        width = width_old * factor
+        return height, width
+    return (height, *args[1:])
+
+
+###
+##  GET ITEM
+#
+
+def add_item(prms, subgroup, out):
+    """Returns False if object has zero height and doesn't get drawn.
+    prms = ObjParams(shape, r, fi, args, color)"""
+    item = get_item(prms)
+    if not item:
+        return False
+    out.append(item._replace(fi=get_rad(prms.fi)), subgroup)
+    return True
+
+
+def get_item(prms):
+    """Returns prms as they get stored in display list, except for fi that is
+    still in fractions of the circle, or None if object has zero height.
+    prms = ObjParams(shape, r, fi, args, color)"""
+    height = get_height(prms)
+    if height == 0:
+        return None
+    if height < 0:
+        prms = transpose_el_with_neg_height(prms)
+    if INVERT_COLOR and prms.shape != Shape.face:
+        prms = invert_color(prms)
+    return prms
+
+
+def invert_color(prms):
+    new_color = prms.color
+    if prms.color in ('black', 'white', ''):
+        new_color = 'black' if prms.color == 'white' else 'white'
+    return prms._replace(color=new_color)
+
+
+def transpose_el_with_neg_height(prms):
+    """prms = ObjParams(shape, r, fi, args, color)"""
+    height = get_height(prms)
+    args = (-prms.args[0], *prms.args[1:])
+    return ObjParams(prms.shape, prms.r - height, prms.fi, args, prms.color)
+
+
+###
+##  UTIL
+#
+
+def get_height(prms):
+    """prms = ObjParams(shape, r, fi, args, color)"""
+    return prms.shape.get_height(prms.args)
@@ -0,0 +1,178 @@
+import ast
+from collections import namedtuple
+from numbers import Real
+
+from src.fii import get_fii
+from src.shape import Shape
+from src.util import replace_matched_items, resolve_variables, get_enum, \
+    check_args, add_defaults, get_hash
+
+
+RADIUS_KEY = 'RADIUS'
+DIAMETER_KEY = 'DIAMETER'
+UNIT_KEY = 'UNIT'
+
+Watch = namedtuple('Watch', ['r_factor', 'bezel', 'face'])
+Group = namedtuple('Group', ['offset', 'subgroups'])
+Subgroup = namedtuple('Subgroup', ['fii', 'shape', 'args', 'offset', 'color',
+                                   'fixed', 'dbg_context'])
+
+
+class WatchDef(namedtuple('WatchDef', ['variables', 'bezel', 'face', 'key'])):
+    """Parsed watch definition, before the substitution of variables. Key is a
+    hash of the definition, that is used for comparison and hashing, so
+    definitions can be used as cache keys. Its contents must not be modified.
+    """
+
+    __slots__ = ()
+
+    def __eq__(self, other):
+        return isinstance(other, WatchDef) and self.key == other.key
+
+    def __hash__(self):
+        return hash(self.key)
+
+
+###
+##  WATCH DEF
+#
+
+def get_watch_def(watch):
+    """Watch is either a string, a list that was parsed from it, or already
+    a WatchDef."""
+    if isinstance(watch, WatchDef):
+        return watch
+    if isinstance(watch, str):
+        parts = ast.literal_eval(watch)
+        key = get_hash(watch)
+    else:
+        parts = watch
+        key = get_hash(get_repr(watch))
+    variables, bezel, face = get_parts(parts)
+    return WatchDef(variables, bezel, face, key)
+
+
+def get_repr(element):
+    """Returns repr of the element with sorted items of sets, so it doesn't
+    depend on hashing of strings."""
+    if type(element) is set:
+        return f'{{{", ".join(sorted(get_repr(a) for a in element))}}}'
+    if type(element) is list:
+        return f'[{", ".join(get_repr(a) for a in element)}]'
+    if type(element) is dict:
+        items = (f'{get_repr(k)}: {get_repr(v)}' for k, v in element.items())
+        return f'{{{", ".join(items)}}}'
+    return repr(element)
+
+
+def get_parts(parts):
+    dictionary = {}
+    bezel = None
+    if isinstance(parts[0], dict):
+        if len(parts) == 3:
+            dictionary, bezel, elements = parts
+        else:
+            dictionary, elements = parts
+    else:
+        if len(parts) == 2:
+            bezel, elements = parts
+        else:
+            elements = parts[0]
+    return dictionary, bezel, elements
+
+
+###
+##  WATCH
+#
+
+def get_watch_model(watch_def, r_factor=1):
+    """Substitutes variables and returns Watch with validated groups of
+    bezel and face. Offsets and sizes are already multiplied by r_factor and
+    the bezel has negative heights."""
+    variables = watch_def.variables
+    if RADIUS_KEY in variables:
+        radius = variables[RADIUS_KEY]
+        r_factor = 100 / radius
+    elif DIAMETER_KEY in variables:
+        diameter = variables[DIAMETER_KEY]
+        r_factor = 200 / diameter
+    variables = {**variables, UNIT_KEY: 1 / r_factor}
+    bezel, face = sub_variables(variables, watch_def.bezel, watch_def.face)
+    bezel = get_groups(bezel, r_factor, negative=True)
+    face = get_groups(face, r_factor, negative=False)
+    return Watch(r_factor, bezel, face)
+
+
+def sub_variables(variables, bezel, face):
+    variables = resolve_variables(variables, [bezel, face])
+    bezel = replace_matched_items(bezel, variables)
+    face = replace_matched_items(face, variables)
+    return bezel, face
+
+
+def get_groups(elements, r_factor, negative):
+    if not elements:
+        return ()
+    return tuple(get_group(a, r_factor, negative) for a in elements)
+
+
+def get_group(element, r_factor, negative):
+    offset, subgroups = element[0], element[1:]
+    if negative:
+        offset = -offset
+    subgroups = tuple(get_subgroup(a, r_factor, negative) for a in subgroups)
+    return Group(offset * r_factor, subgroups)
+
+
+def get_subgroup(subgroup, r_factor, negative):
+    """Subgroup consists of objects with same properties except for fi."""
+    get_no_el(subgroup)
+    pos, shape_name, args, offset, color = \
+        add_defaults(subgroup, [None, None, None, 0, 'black'])
+    shape_name, fixed, centered = parse_shape(shape_name)
+    shape = get_enum(Shape, shape_name, subgroup)
+    args = get_args(shape, args, r_factor, negative)
+    fii = get_positions(pos, subgroup)
+    offset *= r_factor
+    if centered:
+        offset -= shape.get_height(args) / 2
+    out = Subgroup(fii, shape, args, offset, color, fixed, subgroup)
+    check_args(out, subgroup)
+    return out
+
+
+def get_no_el(subgroup):
+    no_el = len(subgroup)
+    if no_el < 3 or no_el > 5:
+        msg = f'Number of elements in subgroup "{subgroup}" is {no_el}, but ' \
+            'it should be between 3 and 5.'
+        raise ValueError(msg)
+    return no_el
+
+
+def parse_shape(shape_name):
+    fixed = 'fixed' in shape_name
+    centered = 'centered' in shape_name
+    shape_name = shape_name.split()[0]
+    return shape_name, fixed, centered
+
+
+def get_args(shape, args, r_factor, negative):
+    """Returns tuple of arguments with lengths multiplied by r_factor. Face's
+    second argument gets parsed into a WatchDef."""
+    args = list(args)
+    if negative:
+        args[0] = -args[0]
+    for i in range(shape.no_size_args):
+        args[i] = args[i] * r_factor
+    if shape == Shape.face:
+        args[1] = get_watch_def(args[1])
+    return tuple(args)
+
+
+def get_positions(pos, subgroup):
+    if not isinstance(pos, (Real, set, dict, list)):
+        msg = f'Invalid position "{pos}" in subgroup "{subgroup}". Position ' \
+            'should be a number, set, dictionary or list.'
+        raise ValueError(msg)
+    return tuple(get_fii(pos))
@@ -18,7 +18,7 @@ HELP_OPT = OptInfo('help', 'h', False, bool, False)
 
 def get_option_values(options, argv):
     argv = argv[1:]
-    options = tuple([HELP_OPT] + [options])
+    options = tuple([HELP_OPT] + list(options))
     opts, args = parse_options(options, argv)
     opts_dict = {get_opt(options, opt_str): arg for opt_str, arg in opts}
     out = [get_option(a, opts_dict) for a in options]
@@ -30,6 +30,8 @@ def get_option_values(options, argv):
 
 def get_option(opt, opts_dict):
     out = opts_dict.get(opt, opt.default)
+    if out is None:
+        return None
     flag_present = not opt.requires_arg and out == ''
     if flag_present:
         return True
@@ -1,10 +1,104 @@
+from bisect import bisect_left, bisect_right, insort
 from collections import namedtuple
+from functools import lru_cache
+from itertools import chain
 from math import asin, pi, sqrt
 
 
 BORDER_FACTOR = 0.1
+# Number of angular widths that are kept.
+WIDTHS_CACHE_SIZE = 4096
 Range = namedtuple('Range', ['start', 'end'])
-GrpRanges = namedtuple('GrpRanges', ['r', 'ranges'])
+
+
+class OccupiedRanges:
+    """Occupied part of a ring. Ranges are kept merged into a sorted list of
+    disjoint closed ranges, so that both inserts and overlap queries can use
+    bisection."""
+
+    __slots__ = ('starts', 'ends')
+
+    def __init__(self):
+        self.starts = []
+        self.ends = []
+
+    def add(self, ranges):
+        for rng in ranges:
+            self.add_range(rng)
+
+    def add_range(self, rng):
+        start, end = rng.start, rng.end
+        i = bisect_left(self.starts, start)
+        if i > 0 and self.ends[i-1] >= start:
+            i -= 1
+            start = self.starts[i]
+        j = bisect_right(self.starts, end, lo=i)
+        if j > i:
+            end = max(end, self.ends[j-1])
+        self.starts[i:j] = [start]
+        self.ends[i:j] = [end]
+
+    def intersects(self, ranges):
+        if self.is_full():
+            return True
+        return any(self.intersects_range(rng) for rng in ranges)
+
+    def intersects_range(self, rng):
+        i = bisect_right(self.starts, rng.end)
+        return i > 0 and self.ends[i-1] >= rng.start
+
+    def is_full(self):
+        return len(self.starts) == 1 and self.starts[0] <= 0 and \
+            self.ends[0] >= 1
+
+
+class RingIndex:
+    """Occupied ranges of all rings of a part (face or bezel). Rings that get
+    added by objects are inserted into a list that is sorted by radius, while
+    rings of groups get appended to a tail, that gets merged into the list
+    when an object adds a ring with a new radius. 'Rings' maps radius to the
+    last added ring with that radius."""
+
+    __slots__ = ('order', 'tail', 'rings')
+
+    def __init__(self):
+        self.order = []
+        self.tail = []
+        self.rings = {}
+
+    def get_ring(self, r):
+        ring = self.rings.get(r)
+        if ring is None:
+            for item in self.tail:
+                insort(self.order, item, key=get_radius)
+            self.tail.clear()
+            ring = self.rings[r] = OccupiedRanges()
+            insort(self.order, (r, ring), key=get_radius)
+        return ring
+
+    def add_ring(self, r):
+        ring = OccupiedRanges()
+        self.tail.append((r, ring))
+        self.rings[r] = ring
+        return ring
+
+    def get_inner_radius(self, fi, shape, args):
+        """Returns radius of the first ring that is occupied at position fi,
+        or None if there is no such ring. Rings get checked from the end of
+        the tail, skipping the last ring."""
+        rings = chain(reversed(self.tail), reversed(self.order))
+        next(rings, None)
+        for r, ring in rings:
+            if not ring.starts:
+                continue
+            width = get_angular_width(shape, args, r)
+            if pos_occupied(fi, width, ring):
+                return r
+        return None
+
+
+def get_radius(item):
+    return item[0]
 
 
 def range_occupied(curr_ranges, prms):
@@ -13,11 +107,14 @@ def range_occupied(curr_ranges, prms):
     return pos_occupied(prms.fi, width, curr_ranges)
 
 
+def ranges_occupied(curr_ranges, obj_ranges):
+    return curr_ranges.intersects(obj_ranges)
+
+
 def update_ranges(ranges, curr_ranges, prms):
     new_ranges = get_ranges_prms(prms)
-    curr_ranges.extend(new_ranges)
-    rng = get_range(ranges, prms)
-    rng.extend(new_ranges)
+    curr_ranges.add(new_ranges)
+    ranges.get_ring(prms.r).add(new_ranges)
 
 
 def get_ranges_prms(prms):
@@ -25,33 +122,9 @@ def get_ranges_prms(prms):
     return get_ranges(prms.fi, width)
 
 
-def get_range(ranges, prms):
-    for rng in reversed(ranges):
-        if rng.r == prms.r:
-            return rng.ranges
-    out = []
-    rng = GrpRanges(prms.r, out)
-    ranges.append(rng)
-    ranges.sort(key=lambda a: a.r)
-    return out
-
-
 def pos_occupied(fi, width, occupied_ranges):
     ranges = get_ranges(fi, width)
-    for rng in ranges:
-        if rng_intersects(rng, occupied_ranges):
-            return True
-    return False
-
-
-def rng_intersects(rng, filled_ranges):
-    start, end = rng.start, rng.end
-    for fil_range in filled_ranges:
-        f_start, f_end = fil_range.start, fil_range.end
-        if (f_start <= start <= f_end) or (f_start <= end <= f_end) or \
-                (start <= f_start and end >= f_end):
-            return True
-    return False
+    return occupied_ranges.intersects(ranges)
 
 
 def get_ranges(pos, width):
@@ -71,6 +144,7 @@ def get_angular_width(shape, args, r):
     return compute_angular_width(width, r)
 
 
+@lru_cache(maxsize=WIDTHS_CACHE_SIZE)
 def compute_angular_width(width, r):
     tg = sqrt((width/2)**2 + r**2)
     a_sin = (width/2) / tg
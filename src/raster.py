@@ -0,0 +1,621 @@
+import zlib
+from collections import namedtuple
+from functools import lru_cache
+from math import ceil, cos, sin, pi, radians
+from struct import pack
+
+from src.fonts import get_font
+from src.layout import INVERT_COLOR, VER_BORDER, get_layout
+from src.model import get_watch_def, get_watch_model
+from src.shape import Shape
+from src.svg import NUM_FACT, NumOrient, check_num_args, get_num_args, \
+    get_num_str, get_num_rotation, get_moonphase_args, get_octagon_points, \
+    get_arrow_points, get_rhombus_points, get_polygon_points, \
+    get_text_glyphs, get_bent_glyphs, _get_triangle, _get_point
+from src.ttf import get_outline
+from src.util import get_point, get_point_xy
+
+
+# Pixels get divided into SAMPLES x SAMPLES samples for anti-aliasing.
+SAMPLES = 4
+# Number of line segments of a full circle.
+CIRCLE_STEPS = 96
+# Number of layouts of watches and subfaces that are kept.
+LAYOUTS_CACHE_SIZE = 128
+
+PNG_SIGNATURE = b'\x89PNG\r\n\x1a\n'
+
+COLORS = {'black': (0, 0, 0), 'white': (255, 255, 255),
+          'lightgrey': (211, 211, 211), 'lightgray': (211, 211, 211),
+          'grey': (128, 128, 128), 'gray': (128, 128, 128),
+          'darkgrey': (169, 169, 169), 'darkgray': (169, 169, 169),
+          'red': (255, 0, 0), 'green': (0, 128, 0), 'blue': (0, 0, 255),
+          'navy': (0, 0, 128), 'gold': (255, 215, 0),
+          'silver': (192, 192, 192)}
+
+Image = namedtuple('Image', ['width', 'height', 'rows'])
+Path = namedtuple('Path', ['contours', 'color'])
+Rasterizer = namedtuple('Rasterizer', ['rasterize', 'validate'])
+
+RASTERIZERS = {}
+
+
+###
+##  REGISTRY
+#
+
+def register_rasterizer(shape, rasterize, validate=None):
+    """Rasterize receives ObjParams and returns list of Paths of the object.
+    Optional validate works like the one of 'register_renderer()' in
+    'svg.py'."""
+    RASTERIZERS[shape] = Rasterizer(rasterize, validate)
+
+
+###
+##  RASTERIZE
+#
+
+def get_thumbnail(watch, size, r_factor=1):
+    """Returns Image of the watch that is size pixels wide. Watch is either a
+    string with watch definition or a WatchDef."""
+    canvas = Canvas(size, size)
+    factor = size * SAMPLES / 200
+    matrix = multiply(scale(factor), translate(100, 100))
+    draw_watch(canvas, watch, r_factor, matrix)
+    return canvas.get_image()
+
+
+def get_atlas(images, no_columns, size):
+    """Returns Image with passed images arranged in a grid of size x size
+    cells. Images that are None leave an empty cell."""
+    images = list(images)
+    no_lines = ceil(len(images) / no_columns)
+    blank = bytes(COLORS['white']) * size
+    rows = []
+    for line in range(no_lines):
+        line_images = images[line*no_columns:(line+1)*no_columns]
+        line_images += [None] * (no_columns - len(line_images))
+        for y in range(size):
+            rows.append(b''.join(a.rows[y] if a else blank
+                                 for a in line_images))
+    return Image(no_columns * size, no_lines * size, rows)
+
+
+def draw_watch(canvas, watch, r_factor, matrix):
+    """Matrix transforms watch's coordinates into canvas' samples."""
+    display_list, bezel_height, r_factor = get_watch_layout(
+        get_watch_def(watch), r_factor)
+    if bezel_height != 100:
+        matrix = multiply(matrix, scale(200 / (2*bezel_height)))
+    draw_display_list(canvas, display_list, r_factor, matrix)
+
+
+@lru_cache(maxsize=LAYOUTS_CACHE_SIZE)
+def get_watch_layout(watch_def, r_factor):
+    return get_layout(get_watch_model(watch_def, r_factor))
+
+
+def draw_display_list(canvas, display_list, r_factor, matrix):
+    """Objects of shapes without a rasterizer are skipped. Rasterizer gets
+    looked up and validated once per run of objects that only differ in
+    angle."""
+    for start, end in display_list.get_runs():
+        prms = display_list.get_prms(start)
+        if prms.shape == Shape.face:
+            for i in range(start, end):
+                draw_subface(canvas, display_list.get_prms(i), r_factor,
+                             matrix)
+            continue
+        rasterizer = RASTERIZERS.get(prms.shape)
+        if not rasterizer:
+            continue
+        if rasterizer.validate:
+            dbg_context = display_list.get_subgroup(start).dbg_context
+            rasterizer.validate(prms, dbg_context)
+        for fi in display_list.fi[start:end]:
+            for path in rasterizer.rasterize(prms._replace(fi=fi)):
+                canvas.fill(transform(matrix, path.contours), path.color)
+
+
+def draw_subface(canvas, prms, r_factor, matrix):
+    """prms = ObjParams(shape, r, fi, args, color)"""
+    size, watch_def = prms.args[:2]
+    r_factor_sub = 1 if r_factor == 1 else 200/(size/r_factor)
+    p = get_point(prms.fi, prms.r - size/2)
+    fill_color = 'black' if INVERT_COLOR else 'white'
+    bckg = get_disk(p.x, p.y, size/2 + VER_BORDER)
+    canvas.fill(transform(matrix, [bckg]), fill_color)
+    matrix = multiply(matrix, multiply(translate(p.x, p.y), scale(size/200)))
+    draw_watch(canvas, watch_def, r_factor_sub, matrix)
+
+
+###
+##  SHAPES
+#
+
+def get_line(prms):
+    """prms = ObjParams(shape, r, fi, args, color)"""
+    height, width = prms.args
+    p1 = get_point(prms.fi, prms.r)
+    p2 = get_point(prms.fi, prms.r - height)
+    return [Path([get_stroke(p1, p2, width)], prms.color)]
+
+
+def get_rounded_line(prms):
+    height, width = prms.args
+    rect = get_rounded_rect(-width/2, prms.r - height, width, abs(height),
+                            width/2)
+    return [Path(transform(rotate(prms.fi - pi/2), [rect]), 'black')]
+
+
+def get_two_lines(prms):
+    height, width, sep = prms.args
+    p1 = get_point(prms.fi, prms.r - height)
+    p2 = get_point(prms.fi, prms.r)
+    factor = width / 2 * (1 + sep)
+    dx = sin(prms.fi) * factor
+    dy = cos(prms.fi) * factor
+    line_1 = get_stroke(get_point_xy(p1.x + dx, p1.y + dy),
+                        get_point_xy(p2.x + dx, p2.y + dy), width)
+    line_2 = get_stroke(get_point_xy(p1.x - dx, p1.y - dy),
+                        get_point_xy(p2.x - dx, p2.y - dy), width)
+    return [Path([line_1], prms.color), Path([line_2], prms.color)]
+
+
+def get_circle(prms):
+    diameter = prms.args[0]
+    p = get_point(prms.fi, prms.r - diameter / 2)
+    return [Path([get_disk(p.x, p.y, abs(diameter) / 2)], 'black')]
+
+
+def get_triangle(prms):
+    height, width = prms.args
+    p1 = get_point(prms.fi, prms.r)
+    p2 = get_point(prms.fi, prms.r - height)
+    dx, dy = sin(prms.fi) * width / 2, cos(prms.fi) * width / 2
+    triangle = [(p1.x - dx, p1.y + dy), (p1.x + dx, p1.y - dy), p2]
+    return [Path([triangle], 'black')]
+
+
+def get_upside_triangle(prms):
+    height, width = prms.args
+    p1 = get_point(prms.fi, prms.r)
+    p2 = get_point(prms.fi, prms.r - height)
+    dx, dy = sin(prms.fi) * width / 2, cos(prms.fi) * width / 2
+    triangle = [p1, (p2.x - dx, p2.y + dy), (p2.x + dx, p2.y - dy)]
+    return [Path([triangle], 'black')]
+
+
+def get_square(prms):
+    height = prms.args[0]
+    return get_line(prms._replace(args=(height, height)))
+
+
+def get_border(prms, shifted=False):
+    """Mirrors '_get_border()' in 'svg.py'."""
+    height = prms.args[0]
+    r = prms.r - height / 2
+    fi = 1 if len(prms.args) < 2 else prms.args[1]
+    if fi >= 1:
+        contours = get_annulus(0, 0, r + height/2, r - height/2)
+        return [Path(contours, prms.color)]
+    rng = fi * 2 * pi / 2
+    if not shifted:
+        start_fi, end_fi = prms.fi - rng, prms.fi + rng
+    else:
+        start_fi, end_fi = prms.fi, prms.fi + (2 * rng)
+    outer = get_arc(0, 0, r + height/2, start_fi, end_fi)
+    inner = get_arc(0, 0, r - height/2, start_fi, end_fi)
+    return [Path([outer + inner[::-1]], prms.color)]
+
+
+def get_shifted_border(prms):
+    return get_border(prms, shifted=True)
+
+
+def get_moonphase(prms):
+    """Mirrors 'get_moonphase()' in 'svg.py'."""
+    stroke_width = 1.7
+    height, r1, r2, r3, r4 = get_moonphase_args(prms)
+    pos = get_point(prms.fi, prms.r - height / 2)
+    t1 = _get_triangle(r3 + r1, r1 + r2, r2 + r3)
+    p1_a = _get_point(t1)
+    t2 = _get_triangle(r3 + r1, r4 - r1, r2 + r3)
+    p1_b = _get_point(t2)
+    arcs = [
+        get_svg_arc(p1_a.x, -p1_a.y, r1, t1.fi_b, -pi - t1.fi_a),
+        get_svg_arc(p1_b.x, -p1_b.y, r1, -t2.fi_a, t2.fi_b),
+        get_svg_arc(-p1_a.x, -p1_a.y, r1, t1.fi_a, -pi - t1.fi_b),
+        get_svg_arc(-p1_b.x, -p1_b.y, r1, pi - t2.fi_b, pi + t2.fi_a),
+        get_svg_arc(0, 0, r2, -pi + t1.fi_a, -t1.fi_a),
+        get_svg_arc(r2 + r3, 0, r3, -pi + t1.fi_b, -pi + t2.fi_b),
+        get_svg_arc(-(r2 + r3), 0, r3, -t2.fi_b, -t1.fi_b),
+        get_svg_arc(0, 0, r4, -pi + t2.fi_a, -t2.fi_a)
+    ]
+    contours = [a for arc in arcs for a in get_polyline_stroke(arc,
+                                                               stroke_width)]
+    matrix = multiply(translate(pos.x, pos.y), scale(height/100))
+    return [Path(transform(matrix, contours), prms.color)]
+
+
+def get_number(prms):
+    """Mirrors 'get_number()' in 'svg.py'."""
+    args = get_num_args(prms)
+    r = prms.r - args.size / 2
+    p = get_point(prms.fi, r)
+    text = get_num_str(args.kind, prms.fi)
+    rot = get_num_rotation(args.orient, prms.fi)
+    return [get_text(text, p, args.size, rot, prms.color, args.font)]
+
+
+def get_bent_number(prms):
+    """Mirrors 'get_bent_rotated()' in 'svg.py'."""
+    args = get_num_args(prms)
+    if args.orient == NumOrient.horizontal:
+        return get_number(prms)
+    font = get_font(args.font)
+    contours = []
+    for glyph, matrix in get_bent_glyphs(prms, args, font):
+        contours.extend(transform(matrix, get_outline(font, glyph)))
+    return [Path(contours, prms.color)]
+
+
+def get_date(prms):
+    """Mirrors 'get_date()' in 'svg.py'."""
+    bckg = get_line(prms)
+    height, width = prms.args
+    if prms.fi in [0, pi]:
+        txt_size = height - 2
+    else:
+        txt_size = width - 6
+    color = 'white' if prms.color == 'black' else 'black'
+    prms = prms._replace(shape=Shape.number,
+                         r=prms.r - height / 2 + txt_size / 2,
+                         args=[txt_size, '27', 'horizontal'], color=color)
+    return bckg + get_number(prms)
+
+
+def get_lange_date(prms):
+    """Mirrors 'get_lange_date()' in 'svg.py'."""
+    height = prms.args[0]
+    orig_height = 74
+    width = height * (122 / orig_height)
+    line_width = height * (8 / orig_height)
+    text_size = height * (46 / orig_height)
+    text_1x = height * (-28.5 / orig_height)
+    text_2x = -text_1x
+    lines = [
+        (-width / 2, 0, width / 2, 0, height, 'white'),
+        (-width / 2, (-height / 2) + line_width / 2, width / 2,
+         (-height / 2) + line_width / 2, line_width, 'black'),
+        (-width / 2, (height / 2) - line_width / 2, width / 2,
+         (height / 2) - line_width / 2, line_width, 'black'),
+        (-width / 2 + line_width / 2, -height / 2,
+         -width / 2 + line_width / 2, height / 2, line_width, 'black'),
+        (0, -height / 2, 0, height / 2, line_width, 'black'),
+        (width / 2 - line_width / 2, -height / 2,
+         width / 2 - line_width / 2, height / 2, line_width, 'black')
+    ]
+    out = [get_line_path(*a) for a in lines]
+    for text, x in (('2', text_1x), ('5', text_2x)):
+        point = get_point_xy(x, -height*0.065)
+        out.append(get_text(text, point, text_size, 0, 'black', 'lange_thin'))
+    pos = get_point(prms.fi, prms.r - height / 2)
+    return move_paths(out, translate(pos.x, pos.y))
+
+
+def get_patek_date(prms):
+    """Mirrors 'get_patek_date()' in 'svg.py'."""
+    height = prms.args[0]
+    orig_height = 47
+    width_all = height * (125 / orig_height)
+    width_single = height * (60 / orig_height)
+    line_width = height * (1 / orig_height)
+    border_width = height * (9 / orig_height)
+    text_size = height * (22 / orig_height)
+    left_window = _get_patek_window('MON', height, width_single, line_width,
+                                    border_width, text_size)
+    right_window = _get_patek_window('JUL', height, width_single, line_width,
+                                     border_width, text_size)
+    out = move_paths(left_window, translate(-width_all/2, 0)) + \
+        move_paths(right_window, translate((width_all-2*width_single)/2, 0))
+    p = get_point(prms.fi, prms.r)
+    return move_paths(out, translate(p.x, p.y))
+
+
+def _get_patek_window(text, height, width, line_width, border_width,
+                      text_size):
+    outer_rect = _get_rectangle_l(width, height, line_width)
+    inner_rect = _get_rectangle_l(width - 2 * border_width,
+                                  height - 2 * border_width, line_width)
+    inner_rect = move_paths(inner_rect, translate(border_width, border_width))
+    b = border_width
+    diagonals = [get_line_path(0, 0, b, b, line_width, 'lightgrey'),
+                 get_line_path(width, 0, width - b, b, line_width,
+                               'lightgrey'),
+                 get_line_path(0, height, b, height - b, line_width,
+                               'lightgrey'),
+                 get_line_path(width, height, width - b, height - b,
+                               line_width, 'lightgrey')]
+    text = get_text(text, get_point_xy(width / 2, height / 2), text_size, 0,
+                    'black', 'patek_date')
+    return outer_rect + inner_rect + diagonals + [text]
+
+
+def _get_rectangle_l(width, height, stroke_width):
+    return [get_line_path(0, 0, width, 0, stroke_width, 'black'),
+            get_line_path(0, height, width, height, stroke_width, 'black'),
+            get_line_path(0, 0, 0, height, stroke_width, 'black'),
+            get_line_path(width, 0, width, height, stroke_width, 'black')]
+
+
+def get_octagon(prms):
+    return get_polygon(prms, get_octagon_points(prms))
+
+
+def get_arrow(prms):
+    return get_polygon(prms, get_arrow_points(prms))
+
+
+def get_rhombus(prms):
+    return get_polygon(prms, get_rhombus_points(prms))
+
+
+def get_polygon(prms, points):
+    """Mirrors '_get_polygon()' in 'svg.py'."""
+    return [Path([get_polygon_points(prms.fi, points)], prms.color)]
+
+
+###
+##  TEXT
+#
+
+def get_text(text, point, size, rotation, color, font_name):
+    """Mirrors '_get_text()' in 'svg.py'. Text is centered horizontally and
+    its middle is at the point. Rotation is in degrees."""
+    font = get_font(font_name)
+    matrix = multiply(translate(point.x, point.y),
+                      multiply(rotate(radians(rotation)),
+                               translate(0, size/NUM_FACT)))
+    contours = []
+    for glyph, glyph_matrix in get_text_glyphs(str(text), size, font):
+        contours.extend(transform(multiply(matrix, glyph_matrix),
+                                  get_outline(font, glyph)))
+    return Path(contours, color)
+
+
+###
+##  GEOMETRY
+#
+
+def get_stroke(p1, p2, width):
+    """Returns rectangle of the line between points, without caps."""
+    x1, y1 = p1
+    x2, y2 = p2
+    length = ((x2 - x1)**2 + (y2 - y1)**2) ** 0.5
+    if length == 0:
+        return []
+    nx = (y1 - y2) / length * width / 2
+    ny = (x2 - x1) / length * width / 2
+    return [(x1 + nx, y1 + ny), (x2 + nx, y2 + ny), (x2 - nx, y2 - ny),
+            (x1 - nx, y1 - ny)]
+
+
+def get_polyline_stroke(points, width):
+    return [get_stroke(p1, p2, width) for p1, p2 in zip(points, points[1:])]
+
+
+def get_line_path(x1, y1, x2, y2, width, color):
+    return Path([get_stroke((x1, y1), (x2, y2), width)], color)
+
+
+def get_disk(x, y, r):
+    return get_arc(x, y, r, 0, 2*pi)[:-1]
+
+
+def get_annulus(x, y, r_outer, r_inner):
+    """Inner circle goes in the opposite direction, so it becomes a hole."""
+    return [get_disk(x, y, r_outer), get_disk(x, y, r_inner)[::-1]]
+
+
+def get_arc(x, y, r, start_fi, end_fi):
+    """Returns points of the arc from start to end angle."""
+    no_steps = max(2, ceil(abs(end_fi - start_fi) / (2*pi) * CIRCLE_STEPS))
+    delta = (end_fi - start_fi) / no_steps
+    return [(x + r * cos(start_fi + i*delta), y + r * sin(start_fi + i*delta))
+            for i in range(no_steps + 1)]
+
+
+def get_svg_arc(x, y, r, start_fi, end_fi):
+    """Returns points of the arc that 'describe_arc()' in 'svg.py' describes
+    with arc_sweep 0. It goes from end to start angle the short way."""
+    span = (end_fi - start_fi) % (2*pi)
+    return get_arc(x, y, r, end_fi, end_fi - span)
+
+
+def get_rounded_rect(x, y, width, height, r):
+    """Radius gets reduced to half of the shorter side."""
+    r = min(r, width/2, height/2)
+    right, bottom = x + width - r, y + height - r
+    corners = [(right, y + r, -pi/2), (right, bottom, 0),
+               (x + r, bottom, pi/2), (x + r, y + r, pi)]
+    out = []
+    for cx, cy, fi in corners:
+        out.extend(get_arc(cx, cy, r, fi, fi + pi/2))
+    return out
+
+
+def move_paths(paths, matrix):
+    return [Path(transform(matrix, a.contours), a.color) for a in paths]
+
+
+###
+##  MATRIX
+#
+# Matrices are tuples (a, b, c, d, e, f), like the SVG transforms, that map
+# point (x, y) to (a*x + c*y + e, b*x + d*y + f).
+
+def multiply(m1, m2):
+    """Returns matrix that first applies m2 and then m1."""
+    a1, b1, c1, d1, e1, f1 = m1
+    a2, b2, c2, d2, e2, f2 = m2
+    return (a1*a2 + c1*b2, b1*a2 + d1*b2, a1*c2 + c1*d2, b1*c2 + d1*d2,
+            a1*e2 + c1*f2 + e1, b1*e2 + d1*f2 + f1)
+
+
+def translate(x, y):
+    return 1, 0, 0, 1, x, y
+
+
+def scale(factor):
+    return factor, 0, 0, factor, 0, 0
+
+
+def rotate(fi):
+    return cos(fi), sin(fi), -sin(fi), cos(fi), 0, 0
+
+
+def transform(matrix, contours):
+    a, b, c, d, e, f = matrix
+    return [[(a*x + c*y + e, b*x + d*y + f) for x, y in contour]
+            for contour in contours]
+
+
+###
+##  CANVAS
+#
+
+class Canvas:
+    """White RGB image whose pixels consist of SAMPLES x SAMPLES samples.
+    Shapes get filled sample by sample, and pixels get the average color of
+    their samples when the image is created."""
+
+    __slots__ = ('width', 'height', 'rows')
+
+    def __init__(self, width, height):
+        self.width = width
+        self.height = height
+        row = bytes(COLORS['white']) * (width * SAMPLES)
+        self.rows = [bytearray(row) for _ in range(height * SAMPLES)]
+
+    def fill(self, contours, color):
+        """Fills the area of contours with nonzero winding rule. Contours are
+        lists of points in coordinates of samples."""
+        edges = get_edges(contours)
+        if not edges:
+            return
+        rgb = bytes(get_rgb(color))
+        no_columns = self.width * SAMPLES
+        min_y = max(0, ceil(edges[0][0] - 0.5))
+        max_y = min(len(self.rows), ceil(max(a[1] for a in edges) - 0.5))
+        active = []
+        i = 0
+        for row in range(min_y, max_y):
+            y = row + 0.5
+            while i < len(edges) and edges[i][0] <= y:
+                active.append(edges[i])
+                i += 1
+            active = [a for a in active if a[1] > y]
+            crossings = sorted((x + (y - y1) * slope, direction)
+                               for y1, _, x, slope, direction in active)
+            winding = 0
+            for x, direction in crossings:
+                if winding == 0:
+                    start = x
+                winding += direction
+                if winding == 0:
+                    self.fill_span(row, start, x, rgb, no_columns)
+
+    def fill_span(self, row, start, end, rgb, no_columns):
+        """Fills samples whose centers are between start and end."""
+        start = min(max(0, ceil(start - 0.5)), no_columns)
+        end = min(max(0, ceil(end - 0.5)), no_columns)
+        if start < end:
+            self.rows[row][start*3:end*3] = rgb * (end - start)
+
+    def get_image(self):
+        no_samples = SAMPLES * SAMPLES
+        step = 3 * SAMPLES
+        rows = []
+        for y in range(self.height):
+            sample_rows = self.rows[y*SAMPLES:(y+1)*SAMPLES]
+            row = bytearray(self.width * 3)
+            for channel in range(3):
+                columns = [a[3*i + channel::step] for a in sample_rows
+                           for i in range(SAMPLES)]
+                row[channel::3] = bytes(a // no_samples for a in
+                                        map(sum, zip(*columns)))
+            rows.append(bytes(row))
+        return Image(self.width, self.height, rows)
+
+
+def get_edges(contours):
+    """Returns non-horizontal edges sorted by their top. Edge is a tuple of
+    top and bottom y, x at the top, slope and direction."""
+    out = []
+    for contour in contours:
+        for (x1, y1), (x2, y2) in zip(contour, contour[1:] + contour[:1]):
+            if y1 == y2:
+                continue
+            direction = 1 if y2 > y1 else -1
+            if y1 > y2:
+                x1, y1, x2, y2 = x2, y2, x1, y1
+            out.append((y1, y2, x1, (x2 - x1) / (y2 - y1), direction))
+    out.sort()
+    return out
+
+
+def get_rgb(color):
+    """Color is a name, '#rrggbb', '#rgb' or 'rgb(r, g, b)'. Unknown colors
+    are black."""
+    color = color.strip().lower()
+    if color in COLORS:
+        return COLORS[color]
+    if color.startswith('#') and len(color) in (4, 7):
+        digits = color[1:] if len(color) == 7 else \
+            ''.join(a * 2 for a in color[1:])
+        return tuple(int(digits[i:i+2], 16) for i in (0, 2, 4))
+    if color.startswith('rgb(') and color.endswith(')'):
+        return tuple(int(float(a)) for a in color[4:-1].split(',')[:3])
+    return COLORS['black']
+
+
+###
+##  PNG
+#
+
+def get_png(image):
+    """Returns bytes of 8-bit RGB PNG file."""
+    header = pack('>IIBBBBB', image.width, image.height, 8, 2, 0, 0, 0)
+    data = b''.join(b'\x00' + a for a in image.rows)
+    return PNG_SIGNATURE + get_chunk(b'IHDR', header) + \
+        get_chunk(b'IDAT', zlib.compress(data, 9)) + get_chunk(b'IEND', b'')
+
+
+def get_chunk(kind, data):
+    crc = zlib.crc32(kind + data)
+    return pack('>I', len(data)) + kind + data + pack('>I', crc)
+
+
+###
+##  BUILT-IN RASTERIZERS
+#
+
+register_rasterizer(Shape.number, get_number, check_num_args)
+register_rasterizer(Shape.bent_number, get_bent_number, check_num_args)
+register_rasterizer(Shape.border, get_border)
+register_rasterizer(Shape.shifted_border, get_shifted_border)
+register_rasterizer(Shape.line, get_line)
+register_rasterizer(Shape.rounded_line, get_rounded_line)
+register_rasterizer(Shape.two_lines, get_two_lines)
+register_rasterizer(Shape.circle, get_circle)
+register_rasterizer(Shape.triangle, get_triangle)
+register_rasterizer(Shape.upside_triangle, get_upside_triangle)
+register_rasterizer(Shape.square, get_square)
+register_rasterizer(Shape.octagon, get_octagon)
+register_rasterizer(Shape.arrow, get_arrow)
+register_rasterizer(Shape.rhombus, get_rhombus)
+register_rasterizer(Shape.date, get_date)
+register_rasterizer(Shape.lange_date, get_lange_date)
+register_rasterizer(Shape.patek_date, get_patek_date)
+register_rasterizer(Shape.moonphase, get_moonphase)
@@ -0,0 +1,171 @@
+import os
+import sys
+from collections import namedtuple
+from concurrent.futures import ProcessPoolExecutor
+from hashlib import sha256
+from http import HTTPStatus
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from threading import BoundedSemaphore
+from urllib.parse import unquote, urlsplit
+
+from src.svg import get_document
+from src.util import Cache, read_file
+
+
+# Number of requests per worker that can wait for a free worker. Requests
+# above that are rejected with 503, so the latency stays bounded.
+QUEUE_PER_JOB = 4
+CACHE_SIZE = 256
+MAX_BODY = 1 << 20
+RETRY_AFTER = 1
+
+Service = namedtuple('Service', ['render', 'watches_dir', 'executor', 'slots',
+                                 'cache'])
+Result = namedtuple('Result', ['svg', 'etag'])
+
+
+###
+##  SERVE
+#
+
+def serve(address, render, watches_dir, jobs):
+    """Serves svgs of watches over HTTP until interrupted. Address is
+    '[HOST:]PORT'. Render receives watch definition and returns its svg. It
+    runs in a pool of jobs processes, so it must be picklable."""
+    host, port = get_host_and_port(address)
+    executor = ProcessPoolExecutor(max_workers=jobs)
+    slots = BoundedSemaphore(jobs * (1 + QUEUE_PER_JOB))
+    service = Service(render, watches_dir, executor, slots, Cache(CACHE_SIZE))
+    handler = type('Handler', (RequestHandler, ), {'service': service})
+    server = Server((host, port), handler)
+    print(f'Serving on http://{host}:{server.server_port}, press Ctrl-C to '
+          'stop.', file=sys.stderr)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        executor.shutdown(cancel_futures=True)
+
+
+def get_host_and_port(address):
+    host, _, port = address.rpartition(':')
+    return host or 'localhost', int(port)
+
+
+###
+##  HANDLER
+#
+
+class Server(ThreadingHTTPServer):
+    """Backlog is large enough for bursts of connections to reach the
+    handler, which rejects the ones that don't fit into the queue."""
+    daemon_threads = True
+    request_queue_size = 128
+
+
+class RequestHandler(BaseHTTPRequestHandler):
+    """'GET /<watch file>' renders the file from the watches folder and
+    'POST /' renders the watch definition in the body. Responses carry an
+    ETag, and requests with a matching 'If-None-Match' get 304."""
+
+    service = None
+
+    def do_GET(self):
+        name = unquote(urlsplit(self.path).path).lstrip('/')
+        path = os.path.join(self.service.watches_dir, name)
+        if not name or os.path.basename(name) != name or \
+                not os.path.isfile(path):
+            self.send_text(HTTPStatus.NOT_FOUND,
+                           f'File "{name}" does not exist.')
+            return
+        self.send_watch(''.join(read_file(path)))
+
+    def do_POST(self):
+        length = get_length(self.headers.get('Content-Length'))
+        if length is None:
+            self.send_text(HTTPStatus.BAD_REQUEST,
+                           'Content-Length is missing or invalid.')
+            return
+        if length > MAX_BODY:
+            self.send_text(HTTPStatus.REQUEST_ENTITY_TOO_LARGE,
+                           f'Definition is larger than {MAX_BODY} bytes.')
+            return
+        try:
+            watch = self.rfile.read(length).decode('utf-8')
+        except UnicodeDecodeError:
+            self.send_text(HTTPStatus.BAD_REQUEST,
+                           'Definition is not valid UTF-8.')
+            return
+        self.send_watch(watch)
+
+    def send_watch(self, watch):
+        key = get_digest(watch)
+        result = self.service.cache.get(key)
+        if result is None:
+            result = self.render(watch)
+            if result is None:
+                return
+            self.service.cache.put(key, result)
+        if result.etag in self.get_etags():
+            self.send_response(HTTPStatus.NOT_MODIFIED)
+            self.send_header('ETag', result.etag)
+            self.end_headers()
+            return
+        body = get_document(result.svg).encode()
+        self.send_response(HTTPStatus.OK)
+        self.send_header('Content-Type', 'image/svg+xml; charset=utf-8')
+        self.send_header('Content-Length', str(len(body)))
+        self.send_header('ETag', result.etag)
+        self.send_header('Cache-Control', 'no-cache')
+        self.end_headers()
+        self.wfile.write(body)
+
+    def render(self, watch):
+        """Returns Result or None if an error response was sent instead."""
+        if not self.service.slots.acquire(blocking=False):
+            self.send_text(HTTPStatus.SERVICE_UNAVAILABLE,
+                           'Too many requests are waiting to be rendered.',
+                           {'Retry-After': str(RETRY_AFTER)})
+            return None
+        try:
+            svg = self.service.executor.submit(self.service.render,
+                                               watch).result()
+        except Exception as e:
+            self.send_text(HTTPStatus.BAD_REQUEST,
+                           f'Failed to render the watch: {e!r}')
+            return None
+        finally:
+            self.service.slots.release()
+        return Result(svg, f'"{get_digest(svg)}"')
+
+    def get_etags(self):
+        header = self.headers.get('If-None-Match', '')
+        return {a.strip().removeprefix('W/') for a in header.split(',')}
+
+    def send_text(self, status, text, headers=None):
+        body = f'{text}\n'.encode()
+        self.send_response(status)
+        self.send_header('Content-Type', 'text/plain; charset=utf-8')
+        self.send_header('Content-Length', str(len(body)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(body)
+
+
+def get_length(header):
+    """Returns value of the Content-Length header or None if it is missing
+    or not a non-negative integer."""
+    try:
+        length = int(header)
+    except (TypeError, ValueError):
+        return None
+    return length if length >= 0 else None
+
+
+def get_digest(text):
+    """Returns full hash of the text, so keys of the cache and ETags of
+    different requests don't collide."""
+    return sha256(text.encode()).hexdigest()
@@ -1,47 +1,126 @@
 from collections import namedtuple
-from enum import Enum
-
-
-Properties = namedtuple('Properties', ['get_height', 'get_width', 'min_no_args',
-                                       'max_args', 'no_size_args'])
-
-
-class Shape(Enum):
-    """First property is the height formula.
-    Second the is width formula.
-    Third has number of required arguments.
-    Fourth the maximum sizes of the arguments.
-    Fifth defines number of arguments that determine size."""
-
-    number = Properties(lambda a: a[0], lambda a: a[0] * 1.34, None, None, 1)      # height, kind (minute, roman,
-    # hour), orient (horizontal, rotating, half_rotating) [, font]
-    bent_number = Properties(lambda a: a[0], lambda a: a[0] * 1.34, None, None, 1) # height, kind (minute, roman,
-    # hour), orient (horizontal, rotating, half_rotating) [, font]
-    face = Properties(lambda a: a[0], lambda a: a[0], None, None, 1)               # height, params
-    border = Properties(lambda a: a[0], lambda a: a[1], 1, (100, 1), 1)            # height, fi
-    shifted_border = Properties(lambda a: a[0], lambda a: a[1], 1, (100, 1), 1)            # height, fi
-    line = Properties(lambda a: a[0], lambda a: a[1], 2, (100, 100), 2)            # height, width
-    rounded_line = Properties(lambda a: a[0], lambda a: a[1], 2, (100, 100), 2)    # height, width
-    two_lines = Properties(lambda a: a[0], lambda a: 2*a[1] + a[1]*a[2], 3, (100, 100, 10), 2) # height, width, distance_factor
-    circle = Properties(lambda a: a[0], lambda a: a[0], 1, (200, ), 1)             # height
-    triangle = Properties(lambda a: a[0], lambda a: a[1], 2, (100, 100), 2)        # height, width
-    upside_triangle = Properties(lambda a: a[0], lambda a: a[1], 2, (100, 100), 2) # height, width
-    square = Properties(lambda a: a[0], lambda a: a[0], 1, (100, ), 1)             # height
-    octagon = Properties(lambda a: a[0], lambda a: a[1], 3, (100, 100, 1), 2)      # height, width, sides_factor
-    arrow = Properties(lambda a: a[0], lambda a: a[1], 3, (100, 100, 1), 2)        # height, width, angle
-    rhombus = Properties(lambda a: a[0], lambda a: a[1], 2, (100, 100), 2)         # height, width
-    trapeze = Properties(lambda a: a[0], lambda a: a[1], 3, (100, 100, 100), 3)    # height, width, width_2
-    tear = Properties(lambda a: a[0], lambda a: a[1], 2, (100, 100), 2)            # height, width
-    spear = Properties(lambda a: a[0], lambda a: a[1], 3, (100, 100, 1), 2)        # height, width, center
-    date = Properties(lambda a: a[0], lambda a: a[1], 2, (100, 100), 2)            # height, width, params
-    lange_date = Properties(lambda a: a[0], lambda a: a[0]*(122/74), 1, (100, ), 1)      # height
-    patek_date = Properties(lambda a: a[0], lambda a: a[0]*(125/47), 1, (100, ), 1)      # height
-    moonphase = Properties(lambda a: a[0], lambda a: 2*a[0], 1, (100, 10, 40, 80), 1)         # height
-
-    def get_height(self, args):
-        fun = self.value.get_height
-        return fun(args)
-
-    def get_width(self, args):
-        fun = self.value.get_width
-        return fun(args)
+
+
+class ShapeInfo(namedtuple('ShapeInfo', ['name', 'code', 'get_height',
+                                         'get_width', 'min_no_args',
+                                         'max_args', 'no_size_args'])):
+    """Get_height and get_width are formulas that receive the arguments.
+    Min_no_args is the number of required arguments, max_args the maximum
+    sizes of the arguments and no_size_args the number of arguments that
+    determine size. Code is the index of the shape in the registry. Shapes
+    are compared and hashed by identity, so they can be used as keys. They
+    get pickled by name and unpickled into the registered shape."""
+
+    __slots__ = ()
+
+    def __reduce__(self):
+        return get_shape, (self.name, )
+
+    def __eq__(self, other):
+        return self is other
+
+    def __hash__(self):
+        return id(self)
+
+
+class ShapeRegistry:
+    """Shapes by name. They can also be accessed as attributes, like
+    'Shape.line', and iterated over in the order of registration."""
+
+    def __init__(self, name):
+        self.__name__ = name
+        self.shapes = {}
+        self.codes = []
+
+    def __getitem__(self, name):
+        return self.shapes[name]
+
+    def __getattr__(self, name):
+        try:
+            return self.__dict__['shapes'][name]
+        except KeyError:
+            raise AttributeError(name) from None
+
+    def __iter__(self):
+        return iter(self.codes)
+
+    def __len__(self):
+        return len(self.codes)
+
+    def register(self, name, get_height, get_width, min_no_args=None,
+                 max_args=None, no_size_args=1):
+        """Returns new shape. Renderers of the shape are registered with
+        'register_renderer()' in 'svg.py' and 'register_rasterizer()' in
+        'raster.py'."""
+        if name in self.shapes:
+            raise ValueError(f'Shape "{name}" is already registered.')
+        shape = ShapeInfo(name, len(self.codes), get_height, get_width,
+                          min_no_args, max_args, no_size_args)
+        self.shapes[name] = shape
+        self.codes.append(shape)
+        return shape
+
+
+Shape = ShapeRegistry('Shape')
+
+
+def get_shape(name):
+    return Shape[name]
+
+
+def register_shape(name, get_height, get_width, min_no_args=None,
+                   max_args=None, no_size_args=1):
+    return Shape.register(name, get_height, get_width, min_no_args, max_args,
+                          no_size_args)
+
+
+###
+##  BUILT-IN SHAPES
+#
+
+# height, kind (minute, roman, hour), orient (horizontal, rotating,
+# half_rotating) [, font]
+register_shape('number', lambda a: a[0], lambda a: a[0] * 1.34)
+register_shape('bent_number', lambda a: a[0], lambda a: a[0] * 1.34)
+# height, params
+register_shape('face', lambda a: a[0], lambda a: a[0])
+# height, fi
+register_shape('border', lambda a: a[0], lambda a: a[1], 1, (100, 1))
+register_shape('shifted_border', lambda a: a[0], lambda a: a[1], 1, (100, 1))
+# height, width
+register_shape('line', lambda a: a[0], lambda a: a[1], 2, (100, 100), 2)
+register_shape('rounded_line', lambda a: a[0], lambda a: a[1], 2, (100, 100),
+               2)
+# height, width, distance_factor
+register_shape('two_lines', lambda a: a[0], lambda a: 2*a[1] + a[1]*a[2], 3,
+               (100, 100, 10), 2)
+# height
+register_shape('circle', lambda a: a[0], lambda a: a[0], 1, (200, ), 1)
+# height, width
+register_shape('triangle', lambda a: a[0], lambda a: a[1], 2, (100, 100), 2)
+register_shape('upside_triangle', lambda a: a[0], lambda a: a[1], 2,
+               (100, 100), 2)
+# height
+register_shape('square', lambda a: a[0], lambda a: a[0], 1, (100, ), 1)
+# height, width, sides_factor
+register_shape('octagon', lambda a: a[0], lambda a: a[1], 3, (100, 100, 1), 2)
+# height, width, angle
+register_shape('arrow', lambda a: a[0], lambda a: a[1], 3, (100, 100, 1), 2)
+# height, width
+register_shape('rhombus', lambda a: a[0], lambda a: a[1], 2, (100, 100), 2)
+# height, width, width_2
+register_shape('trapeze', lambda a: a[0], lambda a: a[1], 3, (100, 100, 100),
+               3)
+# height, width
+register_shape('tear', lambda a: a[0], lambda a: a[1], 2, (100, 100), 2)
+# height, width, center
+register_shape('spear', lambda a: a[0], lambda a: a[1], 3, (100, 100, 1), 2)
+# height, width, params
+register_shape('date', lambda a: a[0], lambda a: a[1], 2, (100, 100), 2)
+# height
+register_shape('lange_date', lambda a: a[0], lambda a: a[0]*(122/74), 1,
+               (100, ), 1)
+register_shape('patek_date', lambda a: a[0], lambda a: a[0]*(125/47), 1,
+               (100, ), 1)
+register_shape('moonphase', lambda a: a[0], lambda a: 2*a[0], 1,
+               (100, 10, 40, 80), 1)
@@ -0,0 +1,94 @@
+import sys
+from collections import Counter
+from functools import wraps
+from importlib import import_module
+from time import perf_counter
+
+
+# Whether counters get collected. Stages only get timed after 'enable()'
+# wraps their functions, so there is no cost while profiling is off.
+ENABLED = False
+
+STAGES = {}
+COUNTERS = Counter()
+
+# Time spent in the children of each of the stages that are currently
+# running, and number of running calls of each stage.
+_children_times = []
+_running = Counter()
+
+
+###
+##  ENABLE
+#
+
+def enable(stages):
+    """Starts collecting counters and replaces functions of the stages with
+    timed wrappers. Stages is a collection of tuples of module name, function
+    name and name of the stage, which can also be a function that receives
+    the arguments of the call and returns the name."""
+    global ENABLED
+    ENABLED = True
+    for module_name, fun_name, stage in stages:
+        module = sys.modules.get(module_name) or import_module(module_name)
+        fun = getattr(module, fun_name)
+        setattr(module, fun_name, get_timed(fun, stage))
+
+
+def get_timed(fun, stage):
+    get_stage = stage if callable(stage) else lambda *_: stage
+
+    @wraps(fun)
+    def out(*args, **kwargs):
+        name = get_stage(*args, **kwargs)
+        _running[name] += 1
+        _children_times.append(0)
+        start = perf_counter()
+        try:
+            return fun(*args, **kwargs)
+        finally:
+            elapsed = perf_counter() - start
+            children_time = _children_times.pop()
+            if _children_times:
+                _children_times[-1] += elapsed
+            _running[name] -= 1
+            add_time(name, elapsed, elapsed - children_time)
+    return out
+
+
+def add_time(name, elapsed, self_time):
+    """Total time of a recursive stage only includes its outermost call."""
+    calls, total, self_total = STAGES.get(name, (0, 0, 0))
+    if _running[name]:
+        elapsed = 0
+    STAGES[name] = (calls + 1, total + elapsed, self_total + self_time)
+
+
+###
+##  COUNT
+#
+
+def count(name, n=1):
+    if ENABLED:
+        COUNTERS[name] += n
+
+
+###
+##  REPORT
+#
+
+def get_report():
+    """Returns dictionary with number of calls, total time and time without
+    the nested stages of each stage, and with the counters. Stages are sorted
+    by total time."""
+    stages = sorted(STAGES.items(), key=lambda item: item[1][1], reverse=True)
+    return {'stages': {name: {'calls': calls,
+                              'total_ms': round(total * 1000, 3),
+                              'self_ms': round(self_time * 1000, 3)}
+                       for name, (calls, total, self_time) in stages},
+            'counters': dict(sorted(COUNTERS.items()))}
+
+
+def reset():
+    STAGES.clear()
+    COUNTERS.clear()
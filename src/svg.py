@@ -1,16 +1,36 @@
+import re
 from collections import namedtuple
-from math import cos, sin, pi, degrees, atan, sqrt, log10
+from functools import partial
+from math import cos, sin, tan, pi, degrees, atan, sqrt, log10
 from numbers import Real
 from enum import Enum, auto
-from random import random
 
+from src.fonts import get_font
 from src.shape import Shape
-from src.util import get_enum, check_args, get_cent, get_point, get_point_xy, \
-    add_defaults
+from src.ttf import get_advance, get_glyph, get_contours, get_text_width
+from src.util import Cache, get_enum, get_cent, get_point, get_point_xy, \
+    add_defaults, get_hash
 
 
 NUM_FACT = 6
-BENT_DELTA = 0.1
+# Middle of lowercase letters above the baseline, as a fraction of font size.
+X_MIDDLE = 0.25
+# Angle where the shared arcs of bent numbers start. Arcs go twice around the
+# circle, so that every number can be placed at least half a circle away
+# from both of their ends.
+ARC_START = -pi / 2
+
+# Numbers that are not a part of a word, like an id, or of a hex color.
+NUMBER = re.compile(r'(?<![\w.#])-?\d+(?:\.\d+)?(?:e[+-]?\d+)?(?![\w.])')
+# Tag with its attributes, numbers outside of it are text content.
+TAG = re.compile(r'<[^>]*>')
+# Attribute whose value is not quoted.
+UNQUOTED_ATTRIBUTE = re.compile(r'(\s[\w:-]+)=([^"\s>]+)')
+DOCUMENT_HEAD = '<svg xmlns="http://www.w3.org/2000/svg" ' \
+    'xmlns:xlink="http://www.w3.org/1999/xlink" viewBox="-100 -100 200 200">'
+DOCUMENT_TAIL = '</svg>\n'
+# Attributes whose default value is zero.
+ZERO_ATTRIBUTE = re.compile(r' (?:cx|cy|x|y|x1|y1|x2|y2)=("?)0\1(?=[\s/>])')
 
 
 class NumKind(Enum):
@@ -41,30 +61,80 @@ ROMAN = {1: 'I', 2: 'II', 3: 'III', 4: 'IIII', 5: 'V', 6: 'VI', 7: 'VII',
 DAYS = {1: "MON", 2: "TUE", 3: "WED", 4: "THU", 5: "FRI", 6: "SAT", 7: "SUN"}
 MONTHS = {1: "JAN", 2: "FEB", 3: "MAR", 4: "APR", 5: "MAY", 6: "JUN", 7: "JUL",
           8: "AUG", 9: "SEP", 10: "OCT", 11: "NOV", 12: "DEC"}
+NUM_DEFAULTS = [None, 'hour', 'arial', '', '', False]
 
-# Subgroup string used for error messages.
-dbg_context = None
+Renderer = namedtuple('Renderer', ['render', 'render_batch', 'validate',
+                                   'instanced', 'get_defs', 'render_outlines'])
+NumArgs = namedtuple('NumArgs', ['size', 'kind', 'font', 'orient', 'weight',
+                                 'bent'])
+Triangle = namedtuple('Triangle', ['a', 'b', 'c', 'fi_a', 'fi_b', 'fi_c'])
+RENDERERS = {}
 
+# Number of paths of glyph outlines that are kept.
+GLYPHS_CACHE_SIZE = 1024
+# Memo of paths of the outlines of the last used glyphs by their ids, or
+# empty strings for glyphs without outline.
+GLYPHS = Cache(GLYPHS_CACHE_SIZE)
 
-def get_shape(prms, _dbg_context):
-    global dbg_context
-    dbg_context = _dbg_context
-    check_args(prms, dbg_context)
-    fun_name = f'get_{prms.shape.name}'
-    fun = globals()[fun_name]
-    return fun(prms)
 
+###
+##  REGISTRY
+#
 
-def get_number(prms):
-    """namedtuple('ObjParams', ['shape', 'r', 'fi', 'args'])"""
+def register_renderer(shape, render, render_batch=None, validate=None,
+                      instanced=False, get_defs=None, render_outlines=None):
+    """Render receives ObjParams and returns svg of the object. Optional
+    render_batch receives radius, angles (in radians), arguments and color of
+    objects that only differ in angle, and returns list of their svgs.
+    Optional validate receives ObjParams and subgroup string, and raises
+    ValueError if arguments are invalid. Arguments' count and sizes are
+    already checked by the model. Instanced shapes look the same at any angle
+    as when rotated from angle zero. Optional get_defs receives ObjParams and
+    returns dictionary of elements by their ids, that the object references
+    and that need to be added to defs. Optional render_outlines receives
+    ObjParams and defs, and returns svg of the object with its texts drawn as
+    uses of glyph outlines, whose paths it adds to defs. It replaces render
+    and get_defs when drawing outlines."""
+    RENDERERS[shape] = Renderer(render, render_batch, validate, instanced,
+                                get_defs, render_outlines)
+
+
+def get_renderer(prms, dbg_context):
+    """Returns renderer of the shape after validating the arguments. It
+    should be called once per subgroup.
+    prms = ObjParams(shape, r, fi, args, color)"""
+    renderer = RENDERERS.get(prms.shape)
+    if not renderer:
+        msg = f'Shape "{prms.shape.name}" has no renderer. Subgroup ' \
+            f'"{dbg_context}".'
+        raise ValueError(msg)
+    if renderer.validate:
+        renderer.validate(prms, dbg_context)
+    return renderer
+
+
+def get_shape(prms, dbg_context):
+    """prms = ObjParams(shape, r, fi, args, color)"""
+    return get_renderer(prms, dbg_context).render(prms)
+
+
+###
+##  SHAPES
+#
+
+
+def get_number(prms, get_text=None):
+    """Get text draws the text, by default as a text element.
+    namedtuple('ObjParams', ['shape', 'r', 'fi', 'args'])"""
     # namedtuple('NumArgs', ['size', 'kind', 'orient', 'font', 'weight','bent'])
     args = get_num_args(prms)
     r = prms.r - args.size / 2
     p = get_point(prms.fi, r)
     i = get_num_str(args.kind, prms.fi)
     rot = get_num_rotation(args.orient, prms.fi)
-    return _get_text(text=i, point=p, size=args.size, rotation=rot,
-                     color=prms.color, weight=args.weight, font=args.font)
+    get_text = get_text or _get_text
+    return get_text(text=i, point=p, size=args.size, rotation=rot,
+                    color=prms.color, weight=args.weight, font=args.font)
 
 
 def _get_text(text, point, size, rotation, color, weight, font):
@@ -85,46 +155,222 @@ def get_bent_number(prms):
 
 
 def get_bent_rotated(prms, args):
-    """namedtuple('ObjParams', ['shape', 'r', 'fi', 'args'])
+    """Text is placed on the arc that is shared by all bent numbers with the
+    same radius and direction, at the offset of its angle.
+    namedtuple('ObjParams', ['shape', 'r', 'fi', 'args'])
     namedtuple('NumArgs', ['size', 'kind', 'orient', 'font', 'weight',
     'bent'])"""
-    r, delta, sweep = get_bent_prms(prms, args)
-    fi = prms.fi + pi
-    p1 = get_point(fi + delta, r)
-    p2 = get_point(fi - delta, r)
+    r, sweep = get_bent_prms(prms, args)
     i = get_num_str(args.kind, prms.fi)
-    a_id = f'path{i}{fi}{r}{random()}'
-    path = f'M {p1.x} {p1.y} A {r} {r} 0 1 {sweep} {p2.x} {p2.y}'
-    # ruler = f'<path d="{path}" fill="rgba(0,0,0,0)" stroke="#ddd"/>'
-    return '<defs>' \
-           f'<path id="{a_id}" d="{path}"/></defs>' \
-           f'<text font-size="{get_num_size(args.size)}" ' \
+    return f'<text font-size="{get_num_size(args.size)}" ' \
            f'fill = "{prms.color}" ' \
            f'font-family="{args.font}">' \
-           f'<textPath xlink:href="#{a_id}" startOffset="50%" ' \
+           f'<textPath xlink:href="#{get_arc_id(r, sweep)}" ' \
+           f'startOffset="{get_arc_offset(prms.fi, sweep)}%" ' \
            f'text-anchor="middle">{i}</textPath>' \
            '</text>'
 
 
+def get_bent_defs(prms):
+    """Returns dictionary with the arc of the bent number, unless it is
+    horizontal."""
+    args = get_num_args(prms)
+    if args.orient == NumOrient.horizontal:
+        return {}
+    r, sweep = get_bent_prms(prms, args)
+    return {get_arc_id(r, sweep): get_arc(r, sweep)}
+
+
 def get_bent_prms(prms, args):
+    """Returns radius and direction of the arc. Text faces outward if sweep
+    is 1 and inward if it is 0."""
     bottom_half = 0 < prms.fi < pi
     if args.orient == NumOrient.half_rotating and bottom_half:
-        return prms.r, -BENT_DELTA, 0
-    return prms.r - args.size, BENT_DELTA, 1
+        return prms.r, 0
+    return prms.r - args.size, 1
+
+
+def get_arc_id(r, sweep):
+    return f'arc_{get_hash(f"{r} {sweep}")}'
+
+
+def get_arc(r, sweep):
+    """Returns path that goes twice around the circle from ARC_START,
+    clockwise if sweep is 1."""
+    p1 = get_point(ARC_START, r)
+    p2 = get_point(ARC_START + pi, r)
+    half_circles = ''.join(f' A {r} {r} 0 0 {sweep} {p.x} {p.y}'
+                           for p in (p2, p1, p2, p1))
+    return f'<path id="{get_arc_id(r, sweep)}" ' \
+           f'd="M {p1.x} {p1.y}{half_circles}"/>'
+
+
+def get_arc_offset(fi, sweep):
+    """Returns offset of the angle fi along the arc in percents of its length.
+    Offset is between a quarter and three quarters of the arc."""
+    direction = 1 if sweep else -1
+    turns = (direction * (fi - ARC_START) / (2 * pi)) % 1
+    if turns < 0.5:
+        turns += 1
+    return turns / 2 * 100
 
 
 def get_num_args(prms):
     size, kind, font, orient, weight, bent = \
-        add_defaults(prms.args, [None, 'hour', 'arial', '', '', False])
-    NumArgs = namedtuple('NumArgs', ['size', 'kind', 'font', 'orient', 'weight',
-                                     'bent'])
+        add_defaults(prms.args, NUM_DEFAULTS)
     return NumArgs(size, kind, font, get_orient(orient), weight, bent)
 
 
+def check_num_args(prms, dbg_context):
+    """Checks that the orientation of the number exists."""
+    orient = list(add_defaults(prms.args, NUM_DEFAULTS))[3]
+    if orient:
+        get_enum(NumOrient, orient, dbg_context)
+
+
 def get_num_size(size):
     return size * (1 + 1.0 / NUM_FACT * 2)
 
 
+###
+##  OUTLINES
+#
+
+def get_number_outlines(prms, defs):
+    return get_number(prms, partial(get_text_outline, defs=defs))
+
+
+def get_bent_number_outlines(prms, defs):
+    args = get_num_args(prms)
+    if args.orient == NumOrient.horizontal:
+        return get_number_outlines(prms, defs)
+    return get_bent_outline(prms, args, defs)
+
+
+def get_date_outlines(prms, defs):
+    return get_date(prms, partial(get_text_outline, defs=defs))
+
+
+def get_lange_date_outlines(prms, defs):
+    return get_lange_date(prms, partial(get_text_outline, defs=defs))
+
+
+def get_patek_date_outlines(prms, defs):
+    return get_patek_date(prms, partial(get_text_outline, defs=defs))
+
+
+def get_text_outline(text, point, size, rotation, color, weight, font, defs):
+    """Works like '_get_text()', but draws uses of the glyph outlines from
+    the font file, so the text doesn't depend on fonts of the browser. Paths
+    of the glyphs get added to defs. Weight is ignored."""
+    font_file = get_font(font)
+    glyphs = get_text_glyphs(str(text), size, font_file)
+    uses = ''.join(get_glyph_use(font_file, *a, defs) for a in glyphs)
+    return f'<g transform="translate({point.x}, {point.y}), ' \
+           f'rotate({rotation}), translate(0, {size/NUM_FACT})" ' \
+           f'fill="{color}">{uses}</g>'
+
+
+def get_text_glyphs(text, size, font):
+    """Returns glyphs of the text and matrices (a, b, c, d, e, f), like the
+    SVG transforms, that place their outlines, so the text is centered
+    horizontally and its middle is at the origin."""
+    font_size = get_num_size(size)
+    k = font_size / font.units_per_em
+    x = -get_text_width(font, text) * k / 2
+    y = X_MIDDLE * font_size
+    out = []
+    for char in text:
+        glyph = get_glyph(font, char)
+        out.append((glyph, (k, 0, 0, -k, x, y)))
+        x += get_advance(font, glyph) * k
+    return out
+
+
+def get_bent_outline(prms, args, defs):
+    font = get_font(args.font)
+    glyphs = get_bent_glyphs(prms, args, font)
+    uses = ''.join(get_glyph_use(font, *a, defs) for a in glyphs)
+    return f'<g fill="{prms.color}">{uses}</g>'
+
+
+def get_bent_glyphs(prms, args, font):
+    """Returns glyphs of the bent number and matrices that place them along
+    the arc, rotated around their middles."""
+    r, sweep = get_bent_prms(prms, args)
+    direction = 1 if sweep else -1
+    text = str(get_num_str(args.kind, prms.fi))
+    k = get_num_size(args.size) / font.units_per_em
+    distance = -get_text_width(font, text) * k / 2
+    out = []
+    for char in text:
+        glyph = get_glyph(font, char)
+        advance = get_advance(font, glyph) * k
+        fi = prms.fi + direction * (distance + advance/2) / r
+        x, y = cos(fi), sin(fi)
+        out.append((glyph, (-direction * y * k, direction * x * k,
+                            direction * x * k, direction * y * k,
+                            x*r + direction * y * advance/2,
+                            y*r - direction * x * advance/2)))
+        distance += advance
+    return out
+
+
+def get_glyph_use(font, glyph, matrix, defs):
+    """Returns use of the glyph's outline, that is scaled to the size of the
+    matrix, so the remaining transform only moves and rotates it. Path of the
+    outline gets added to defs. Its id depends on the contents of the font
+    file, so it changes when the file does."""
+    a, b, c, d, e, f = matrix
+    k = sqrt(a*a + b*b)
+    glyph_id = f'glyph_{get_hash(f"{font.key} {glyph} {k}")}'
+    path = get_glyph_def(glyph_id, font, glyph, k)
+    if not path:
+        return ''
+    defs[glyph_id] = path
+    if (a, b, c, d) == (k, 0, 0, -k):
+        transform = f'translate({e}, {f})'
+    else:
+        transform = f'matrix({a/k} {b/k} {-c/k} {-d/k} {e} {f})'
+    return f'<use xlink:href="#{glyph_id}" transform="{transform}"/>'
+
+
+def get_glyph_def(glyph_id, font, glyph, k):
+    """Returns path of the glyph's outline scaled by k, with y pointing down
+    and coordinates rounded to thousandths, or empty string if the glyph has
+    no outline. Paths of the last used glyphs are memoized in GLYPHS."""
+    path = GLYPHS.get(glyph_id)
+    if path is None:
+        path = get_glyph_path(glyph_id, font, glyph, k)
+        GLYPHS.put(glyph_id, path)
+    return path
+
+
+def get_glyph_path(glyph_id, font, glyph, k):
+    contours = get_contours(font, glyph)
+    if not contours:
+        return ''
+    d = ' '.join(get_contour_path(a, k) for a in contours)
+    return f'<path id="{glyph_id}" d="{d}"/>'
+
+
+def get_contour_path(contour, k):
+    """Returns path data of the contour from 'get_contours()' in 'ttf.py',
+    where curves of the font become quadratic Bezier curves."""
+    get_coords = lambda x, y: f'{round(x*k, 3):g} {round(-y*k, 3):g}'
+    out = [f'M {get_coords(*contour[0][:2])}']
+    control = None
+    for x, y, on_curve in contour[1:] + contour[:1]:
+        if not on_curve:
+            control = get_coords(x, y)
+        elif control:
+            out.append(f'Q {control} {get_coords(x, y)}')
+            control = None
+        else:
+            out.append(f'L {get_coords(x, y)}')
+    return ' '.join(out) + ' Z'
+
+
 def get_border(prms):
     return _get_border(prms)
 
@@ -165,7 +411,7 @@ def get_line(prms):
     return _get_line(p1.x, p1.y, p2.x, p2.y, width, prms.color)
 
 
-def get_date(prms):
+def get_date(prms, get_text=None):
     """namedtuple('ObjParams', ['shape', 'r', 'fi', 'args', 'color'])"""
     bckg = get_line(prms)
     height, width = prms.args
@@ -175,14 +421,14 @@ def get_date(prms):
         txt_size = width - 6
 
     color = 'white' if prms.color == 'black' else 'black'
-    Prms = namedtuple('Prms', ['shape', 'r', 'fi', 'args', 'color'])
-    prms = Prms(Shape.number, prms.r - height / 2 + txt_size / 2, prms.fi,
-                [txt_size, '27', 'horizontal'], color)
-    txt = get_number(prms)
+    prms = prms._replace(shape=Shape.number,
+                         r=prms.r - height / 2 + txt_size / 2,
+                         args=[txt_size, '27', 'horizontal'], color=color)
+    txt = get_number(prms, get_text)
     return bckg + txt
 
 
-def get_lange_date(prms):
+def get_lange_date(prms, get_text=None):
     height = prms.args[0]
     orig_height = 74
     width = height * (122 / orig_height)
@@ -202,19 +448,22 @@ def get_lange_date(prms):
     line_5 = _get_line(width / 2 - line_width / 2, -height / 2,
                        width / 2 - line_width / 2, height / 2, line_width,
                        'black')
-    num_1 = get_lange_number(text='2', x=text_1x, size=text_size, height=height)
-    num_2 = get_lange_number(text='5', x=text_2x, size=text_size, height=height)
+    num_1 = get_lange_number(text='2', x=text_1x, size=text_size,
+                             height=height, get_text=get_text)
+    num_2 = get_lange_number(text='5', x=text_2x, size=text_size,
+                             height=height, get_text=get_text)
     pos = get_point(prms.fi, prms.r - height / 2)
     return f'<g transform="translate({pos.x}, {pos.y})">{surface}{line_1}' \
            f'{line_2}{line_3}{line_4}{line_5}{num_1}{num_2}</g>'
 
 
-def get_lange_number(text, x, size, height):
-    return _get_text(text=text, point=get_point_xy(x, -height*0.065), size=size, 
-                     rotation=0, color='black', weight='', font='lange_thin')
+def get_lange_number(text, x, size, height, get_text=None):
+    get_text = get_text or _get_text
+    return get_text(text=text, point=get_point_xy(x, -height*0.065), size=size,
+                    rotation=0, color='black', weight='', font='lange_thin')
 
 
-def get_patek_date(prms):
+def get_patek_date(prms, get_text=None):
     height = prms.args[0]
     orig_height = 47
     width_all = height * (125 / orig_height)
@@ -223,9 +472,9 @@ def get_patek_date(prms):
     border_width = height * (9 / orig_height)
     text_size = height * (22 / orig_height)
     left_window = _get_patek_window('MON', height, width_single, line_width,
-                                    border_width, text_size)
+                                    border_width, text_size, get_text)
     right_window = _get_patek_window('JUL', height, width_single, line_width,
-                                     border_width, text_size)
+                                     border_width, text_size, get_text)
     win_l = f'<g transform="translate({-width_all/2}, 0)">{left_window}</g>'
     win_r = f'<g transform="translate({(width_all-2*width_single)/2}, 0)">' \
             f'{right_window}</g>'
@@ -234,7 +483,7 @@ def get_patek_date(prms):
 
 
 def _get_patek_window(text, height, width, line_width, border_width,
-                      text_size):
+                      text_size, get_text=None):
     outer_rect = _get_rectangle_l(width=width,
                                   height=height,
                                   stroke_width=line_width,
@@ -250,10 +499,11 @@ def _get_patek_window(text, height, width, line_width, border_width,
                                                   f'{border_width})"')
     diagonals = _get_patek_date_diagonals(width, height, border_width,
                                           line_width, 'lightgrey')
-    text = _get_text(text=text,
-                     point=get_point_xy(width / 2, height / 2),
-                     size=text_size, rotation=0, color='black', weight='',
-                     font='patek_date')
+    get_text = get_text or _get_text
+    text = get_text(text=text,
+                    point=get_point_xy(width / 2, height / 2),
+                    size=text_size, rotation=0, color='black', weight='',
+                    font='patek_date')
     return f'{outer_rect}{inner_rect}{diagonals}{text}'
 
 
@@ -338,9 +588,7 @@ def get_upside_triangle(prms):
 def get_square(prms):
     """namedtuple('ObjParams', ['shape', 'r', 'fi', 'args'])"""
     height = prms.args[0]
-    Prms = namedtuple('Prms', ['shape', 'r', 'fi', 'args', 'color'])
-    prms = Prms(Shape.line, prms.r, prms.fi, [height, height], prms.color)
-    return get_line(prms)
+    return get_line(prms._replace(shape=Shape.line, args=(height, height)))
 
 
 def get_moonphase(prms):
@@ -388,7 +636,6 @@ def _get_point(t):
 
 def _get_triangle(a, b, c):
     fi_a, fi_b, fi_c = _get_angles(a, b, c)
-    Triangle = namedtuple('Triangle', ['a', 'b', 'c', 'fi_a', 'fi_b', 'fi_c'])
     return Triangle(a, b, c, fi_a, fi_b, fi_c)
 
 
@@ -400,21 +647,63 @@ def _get_angles(a, b, c):
         sqrt(z_delta))
 
 
-# def get_octagon(prms, dbg_context):
-#     check_args(prms, dbg_context)
-#     height, width, sides_factor = prms.args
-#
-#
-# def get_arrow(prms, dbg_context):
-#     check_args(prms, dbg_context)
-#     height, width, angle = prms.args
-#
-#
-# def get_rhombus(prms, dbg_context):
-#     check_args(prms, dbg_context)
-#     height, width = prms.args
-#
-#
+def get_octagon(prms):
+    return _get_polygon(prms, get_octagon_points(prms))
+
+
+def get_arrow(prms):
+    return _get_polygon(prms, get_arrow_points(prms))
+
+
+def get_rhombus(prms):
+    return _get_polygon(prms, get_rhombus_points(prms))
+
+
+def get_octagon_points(prms):
+    """Rectangle with corners cut off. Sides factor is the share of the
+    shorter side that gets cut off at each of its ends."""
+    height, width, sides_factor = prms.args
+    r_2 = prms.r - height
+    cut = sides_factor * min(height, width) / 2
+    w = width / 2
+    return [(prms.r, -w + cut), (prms.r, w - cut), (prms.r - cut, w),
+            (r_2 + cut, w), (r_2, w - cut), (r_2, -w + cut), (r_2 + cut, -w),
+            (prms.r - cut, -w)]
+
+
+def get_arrow_points(prms):
+    """Arrow that points toward the center. Angle is the half of the angle
+    of its tip as a share of the right angle. Shaft is a third of the
+    width."""
+    height, width, angle = prms.args
+    tip = prms.r - height
+    head = min(height, width / 2 / tan(angle * pi / 2)) if angle else height
+    w, shaft = width / 2, width / 6
+    return [(tip, 0), (tip + head, w), (tip + head, shaft), (prms.r, shaft),
+            (prms.r, -shaft), (tip + head, -shaft), (tip + head, -w)]
+
+
+def get_rhombus_points(prms):
+    height, width = prms.args
+    middle = prms.r - height / 2
+    return [(prms.r, 0), (middle, width / 2), (prms.r - height, 0),
+            (middle, -width / 2)]
+
+
+def get_polygon_points(fi, points):
+    """Converts points that are defined by their distance from the center
+    and by their offset perpendicular to the angle fi into Points."""
+    cos_fi, sin_fi = cos(fi), sin(fi)
+    return [get_point_xy(cos_fi * d - sin_fi * o, sin_fi * d + cos_fi * o)
+            for d, o in points]
+
+
+def _get_polygon(prms, points):
+    points = ' '.join(f'{p.x},{p.y}' for p in
+                      get_polygon_points(prms.fi, points))
+    return f'<polygon points="{points}" fill="{prms.color}"/>'
+
+
 # def get_trapeze(prms, dbg_context):
 #     check_args(prms, dbg_context)
 #     height, width, width_2 = prms.args
@@ -430,6 +719,103 @@ def _get_angles(a, b, c):
 #     height, width, center = prms.args
 
 
+###
+##  BATCH
+#
+
+def get_lines(r, rads, args, color):
+    height, width = args
+    r_2 = r - height
+    return [_get_line(cos(fi) * r, sin(fi) * r, cos(fi) * r_2, sin(fi) * r_2,
+                      width, color) for fi in rads]
+
+
+def get_rounded_lines(r, rads, args, color):
+    height, width = args
+    start = f'<rect rx="{width/2}" y="{r-height}" x="-{width/2}" ry=' \
+            f'"{width/2}" transform="rotate('
+    end = f')" height="{abs(height)}" width="{width}"></rect>'
+    return [f'{start}{(fi - pi / 2) / pi * 180}{end}' for fi in rads]
+
+
+def get_circles(r, rads, args, color):
+    diameter = args[0]
+    r = r - diameter / 2
+    end = f' r={abs(diameter) / 2} style="stroke-width: 0; fill: rgb(0, 0, ' \
+          f'0);"></circle>'
+    return [f'<circle cx={cos(fi) * r} cy={sin(fi) * r}{end}' for fi in rads]
+
+
+def get_triangles(r, rads, args, color):
+    height, width = args
+    r_2 = r - height
+    out = []
+    for fi in rads:
+        cos_fi, sin_fi = cos(fi), sin(fi)
+        x1 = (cos_fi * r) - (sin_fi * width / 2)
+        y1 = (sin_fi * r) + (cos_fi * width / 2)
+        x2 = (cos_fi * r) + (sin_fi * width / 2)
+        y2 = (sin_fi * r) - (cos_fi * width / 2)
+        x3 = cos_fi * r_2
+        y3 = sin_fi * r_2
+        out.append(f'<polygon points="{x1},{y1} {x2},{y2} {x3},{y3}" />')
+    return out
+
+
+def get_squares(r, rads, args, color):
+    height = args[0]
+    return get_lines(r, rads, [height, height], color)
+
+
+###
+##  INSTANCES
+#
+
+def get_instances(renderer, prms, rads):
+    """Renders object once into a symbol and returns its id, the symbol and
+    uses of the symbol that are rotated to all passed angles (in radians).
+    prms = ObjParams(shape, r, None, args, color)"""
+    svg = renderer.render(prms._replace(fi=0))
+    symbol_id = f'{prms.shape.name}_{get_hash(svg)}'
+    symbol = f'<symbol id="{symbol_id}" overflow="visible">{svg}</symbol>'
+    use = f'<use xlink:href="#{symbol_id}" transform="rotate('
+    uses = [f'{use}{degrees(fi)})"/>' for fi in rads]
+    return symbol_id, symbol, uses
+
+
+###
+##  PRECISION
+#
+
+def round_numbers(svg, precision):
+    """Rounds numbers in attributes of svg to the precision (number of
+    decimal places) and strips attributes that became equal to their default
+    value. Text content is left as it is."""
+    round_ = lambda match: round_number(match.group(), precision)
+    svg = TAG.sub(lambda match: NUMBER.sub(round_, match.group()), svg)
+    return ZERO_ATTRIBUTE.sub('', svg)
+
+
+def round_number(num_str, precision):
+    out = f'{float(num_str):.{precision}f}'
+    if '.' in out:
+        out = out.rstrip('0').rstrip('.')
+    return '0' if out == '-0' else out
+
+
+###
+##  DOCUMENT
+#
+
+def get_document(svg):
+    """Returns svg of a watch as a standalone svg file. Renderers write
+    html, so ampersands get escaped and attribute values quoted to make it
+    valid XML."""
+    svg = svg.replace('&', '&amp;')
+    quote = lambda match: UNQUOTED_ATTRIBUTE.sub(r'\1="\2"', match.group())
+    return f'{DOCUMENT_HEAD}{TAG.sub(quote, svg)}{DOCUMENT_TAIL}'
+
+
 ###
 ##  UTIL
 #
@@ -445,10 +831,9 @@ def describe_arc(x, y, r, start_fi, end_fi, arc_sweep):
 
 
 def polar_to_cartesian(center_x, center_y, radius, fi):
-    Point = namedtuple('Point', list('xy'))
     x = center_x + (radius * cos(fi))
     y = center_y + (radius * sin(fi))
-    return Point(x, y)
+    return get_point_xy(x, y)
 
 
 def _get_line(x1, y1, x2, y2, width, color):
@@ -484,7 +869,7 @@ def _get_num_str(kind_el, deg, use_zero=False, countdown=False):
     else:
         kind = NumKind.hour
         if kind_el:
-            kind = get_enum(NumKind, kind_el, dbg_context)
+            kind = NumKind[kind_el]
         converter = kind.value[1]
         out = converter(deg)
     if countdown and out:
@@ -555,7 +940,7 @@ def get_num_rotation(orient, deg):
 def get_orient(orient_name):
     orient = NumOrient.half_rotating
     if orient_name:
-        orient = get_enum(NumOrient, orient_name, dbg_context)
+        orient = NumOrient[orient_name]
     return orient
 
 
@@ -570,3 +955,33 @@ def get_fi_rotating(fi):
 def get_fi_perpendicular(fi):
     rad = fi if fi <= pi / 2 else fi + pi
     return degrees(rad)
+
+
+###
+##  BUILT-IN RENDERERS
+#
+
+register_renderer(Shape.number, get_number, validate=check_num_args,
+                  render_outlines=get_number_outlines)
+register_renderer(Shape.bent_number, get_bent_number, validate=check_num_args,
+                  get_defs=get_bent_defs,
+                  render_outlines=get_bent_number_outlines)
+register_renderer(Shape.border, get_border)
+register_renderer(Shape.shifted_border, get_shifted_border)
+register_renderer(Shape.line, get_line, get_lines, instanced=True)
+register_renderer(Shape.rounded_line, get_rounded_line, get_rounded_lines,
+                  instanced=True)
+register_renderer(Shape.two_lines, get_two_lines)
+register_renderer(Shape.circle, get_circle, get_circles, instanced=True)
+register_renderer(Shape.triangle, get_triangle, get_triangles, instanced=True)
+register_renderer(Shape.upside_triangle, get_upside_triangle, instanced=True)
+register_renderer(Shape.square, get_square, get_squares, instanced=True)
+register_renderer(Shape.octagon, get_octagon, instanced=True)
+register_renderer(Shape.arrow, get_arrow, instanced=True)
+register_renderer(Shape.rhombus, get_rhombus, instanced=True)
+register_renderer(Shape.date, get_date, render_outlines=get_date_outlines)
+register_renderer(Shape.lange_date, get_lange_date,
+                  render_outlines=get_lange_date_outlines)
+register_renderer(Shape.patek_date, get_patek_date,
+                  render_outlines=get_patek_date_outlines)
+register_renderer(Shape.moonphase, get_moonphase)
@@ -0,0 +1,484 @@
+from collections import namedtuple
+from functools import lru_cache
+from hashlib import sha1
+from struct import pack, unpack_from
+
+
+# Number of line segments that a quadratic curve gets flattened into.
+CURVE_STEPS = 4
+# Number of outlines and contours of glyphs that are kept.
+GLYPHS_CACHE_SIZE = 1024
+
+
+# Flags of simple glyph's points.
+ON_CURVE = 0x01
+X_SHORT = 0x02
+Y_SHORT = 0x04
+REPEAT = 0x08
+X_SAME_OR_POSITIVE = 0x10
+Y_SAME_OR_POSITIVE = 0x20
+
+# Flags of composite glyph's components.
+ARGS_ARE_WORDS = 0x0001
+ARGS_ARE_XY_VALUES = 0x0002
+HAS_SCALE = 0x0008
+MORE_COMPONENTS = 0x0020
+HAS_XY_SCALE = 0x0040
+HAS_2X2 = 0x0080
+
+# Tables that get copied into subsets. Cmap, glyf, head, kern, loca and post
+# get rebuilt, while the rest, like GPOS and GSUB, get left out.
+SUBSET_TABLES = ('OS/2', 'cvt ', 'fpgm', 'gasp', 'hhea', 'hmtx', 'maxp',
+                 'name', 'prep')
+CHECKSUM_MAGIC = 0xB1B0AFBA
+
+
+class Font(namedtuple('Font', ['data', 'tables', 'units_per_em', 'ascent',
+                               'descent', 'long_loca', 'no_glyphs', 'cmap',
+                               'advances', 'key'])):
+    """Fonts are compared and hashed by identity, so they can be used as
+    cache keys. Key is a hash of the font file, that changes with its
+    contents."""
+
+    __slots__ = ()
+
+    def __eq__(self, other):
+        return self is other
+
+    def __hash__(self):
+        return id(self)
+
+
+###
+##  FONT
+#
+
+@lru_cache(maxsize=None)
+def read_font(path):
+    """Reads TrueType font with tables that are needed for drawing of the
+    outlines of glyphs (head, hhea, maxp, hmtx, cmap, loca and glyf)."""
+    with open(path, 'rb') as file:
+        data = file.read()
+    tables = get_tables(data)
+    units_per_em, = unpack_from('>H', data, tables['head'] + 18)
+    long_loca, = unpack_from('>h', data, tables['head'] + 50)
+    ascent, descent = unpack_from('>hh', data, tables['hhea'] + 4)
+    no_h_metrics, = unpack_from('>H', data, tables['hhea'] + 34)
+    no_glyphs, = unpack_from('>H', data, tables['maxp'] + 4)
+    cmap = get_cmap(data, tables['cmap'])
+    advances = get_advances(data, tables['hmtx'], no_h_metrics, no_glyphs)
+    return Font(data, tables, units_per_em, ascent, descent, long_loca == 1,
+                no_glyphs, cmap, advances, sha1(data).hexdigest()[:12])
+
+
+def get_tables(data):
+    """Returns dictionary of offsets of the tables."""
+    no_tables, = unpack_from('>H', data, 4)
+    out = {}
+    for i in range(no_tables):
+        tag, _, offset, _ = unpack_from('>4sLLL', data, 12 + i * 16)
+        out[tag.decode('latin-1').strip()] = offset
+    return out
+
+
+def get_cmap(data, offset):
+    """Returns dictionary of glyph indexes by character codes, read from the
+    Unicode subtable of format 4."""
+    _, no_subtables = unpack_from('>HH', data, offset)
+    for i in range(no_subtables):
+        platform, encoding, sub_offset = \
+            unpack_from('>HHL', data, offset + 4 + i * 8)
+        unicode = platform == 0 or (platform == 3 and encoding in (0, 1))
+        sub_offset += offset
+        format_, = unpack_from('>H', data, sub_offset)
+        if unicode and format_ == 4:
+            return get_cmap_format_4(data, sub_offset)
+    return {}
+
+
+def get_cmap_format_4(data, offset):
+    seg_count = unpack_from('>H', data, offset + 6)[0] // 2
+    ends_offset = offset + 14
+    starts_offset = ends_offset + seg_count * 2 + 2
+    deltas_offset = starts_offset + seg_count * 2
+    range_offsets_offset = deltas_offset + seg_count * 2
+    ends = unpack_from(f'>{seg_count}H', data, ends_offset)
+    starts = unpack_from(f'>{seg_count}H', data, starts_offset)
+    deltas = unpack_from(f'>{seg_count}h', data, deltas_offset)
+    range_offsets = unpack_from(f'>{seg_count}H', data, range_offsets_offset)
+    out = {}
+    for i, (start, end, delta, range_offset) in \
+            enumerate(zip(starts, ends, deltas, range_offsets)):
+        if start == 0xFFFF:
+            continue
+        for code in range(start, end + 1):
+            if range_offset == 0:
+                out[code] = (code + delta) & 0xFFFF
+                continue
+            glyph_offset = range_offsets_offset + i * 2 + range_offset + \
+                (code - start) * 2
+            glyph, = unpack_from('>H', data, glyph_offset)
+            if glyph:
+                out[code] = (glyph + delta) & 0xFFFF
+    return out
+
+
+def get_advances(data, offset, no_h_metrics, no_glyphs):
+    """Returns advance widths of all glyphs. Glyphs after the last metric
+    share its advance."""
+    out = [unpack_from('>H', data, offset + i * 4)[0]
+           for i in range(no_h_metrics)]
+    return tuple(out + [out[-1]] * (no_glyphs - no_h_metrics))
+
+
+###
+##  GLYPHS
+#
+
+def get_glyph(font, char):
+    """Returns index of the glyph of the character, or 0 for the missing
+    glyph."""
+    return font.cmap.get(ord(char), 0)
+
+
+def get_advance(font, glyph):
+    return font.advances[glyph]
+
+
+def get_text_width(font, text):
+    """Returns width of the text in font units."""
+    return sum(get_advance(font, get_glyph(font, a)) for a in text)
+
+
+@lru_cache(maxsize=GLYPHS_CACHE_SIZE)
+def get_outline(font, glyph):
+    """Returns tuple of contours of the glyph, flattened into tuples of
+    points. Coordinates are in font units and y points up."""
+    return tuple(flatten_contour(a) for a in get_contours(font, glyph))
+
+
+@lru_cache(maxsize=GLYPHS_CACHE_SIZE)
+def get_contours(font, glyph):
+    """Returns tuple of contours of the glyph. Contours are tuples of points
+    of quadratic B-spline, that are tuples of x, y and whether point is on
+    curve. They start with a point on curve and there are no consecutive off
+    curve points. Coordinates are in font units and y points up."""
+    data = get_glyph_data(font, glyph)
+    if not data:
+        return ()
+    no_contours, = unpack_from('>h', data)
+    if no_contours < 0:
+        return get_composite_contours(font, data)
+    return get_simple_contours(data, no_contours)
+
+
+def get_glyph_data(font, glyph):
+    if glyph >= font.no_glyphs:
+        return b''
+    loca = font.tables['loca']
+    if font.long_loca:
+        start, end = unpack_from('>LL', font.data, loca + glyph * 4)
+    else:
+        start, end = (a * 2 for a in
+                      unpack_from('>HH', font.data, loca + glyph * 2))
+    glyf = font.tables['glyf']
+    return font.data[glyf + start:glyf + end]
+
+
+def get_simple_contours(data, no_contours):
+    ends = unpack_from(f'>{no_contours}H', data, 10)
+    no_points = ends[-1] + 1 if ends else 0
+    offset = 10 + no_contours * 2
+    instructions_len, = unpack_from('>H', data, offset)
+    offset += 2 + instructions_len
+    flags, offset = get_flags(data, offset, no_points)
+    xs, offset = get_coordinates(data, offset, flags, X_SHORT,
+                                 X_SAME_OR_POSITIVE)
+    ys, offset = get_coordinates(data, offset, flags, Y_SHORT,
+                                 Y_SAME_OR_POSITIVE)
+    out = []
+    start = 0
+    for end in ends:
+        points = [(xs[i], ys[i], flags[i] & ON_CURVE)
+                  for i in range(start, end + 1)]
+        out.append(get_contour(points))
+        start = end + 1
+    return tuple(a for a in out if a)
+
+
+def get_flags(data, offset, no_points):
+    out = []
+    while len(out) < no_points:
+        flag = data[offset]
+        offset += 1
+        out.append(flag)
+        if flag & REPEAT:
+            out.extend([flag] * data[offset])
+            offset += 1
+    return out, offset
+
+
+def get_coordinates(data, offset, flags, short_flag, same_flag):
+    out = []
+    value = 0
+    for flag in flags:
+        if flag & short_flag:
+            delta = data[offset]
+            offset += 1
+            value += delta if flag & same_flag else -delta
+        elif not flag & same_flag:
+            value += unpack_from('>h', data, offset)[0]
+            offset += 2
+        out.append(value)
+    return out, offset
+
+
+def get_contour(points):
+    """Adds the implied on curve points between consecutive off curve points
+    and makes contour start with a point on curve."""
+    if not points:
+        return ()
+    if not points[0][2]:
+        start = points[-1] if points[-1][2] else \
+            get_middle(points[-1], points[0])
+        points = [start] + points
+    out = [points[0]]
+    for point in points[1:]:
+        if not point[2] and not out[-1][2]:
+            out.append(get_middle(out[-1], point))
+        out.append(point)
+    return tuple(out)
+
+
+def flatten_contour(contour):
+    """Converts contour from 'get_contours()' into a polygon."""
+    out = [contour[0][:2]]
+    control = None
+    for x, y, on_curve in contour[1:] + contour[:1]:
+        if on_curve:
+            add_segment(out, control, (x, y))
+            control = None
+        else:
+            control = (x, y)
+    return tuple(out)
+
+
+def get_middle(p1, p2):
+    return (p1[0] + p2[0]) / 2, (p1[1] + p2[1]) / 2, 1
+
+
+def add_segment(points, control, end):
+    if not control:
+        points.append(end)
+        return
+    x0, y0 = points[-1]
+    x1, y1 = control
+    x2, y2 = end
+    for i in range(1, CURVE_STEPS + 1):
+        t = i / CURVE_STEPS
+        s = 1 - t
+        points.append((s*s*x0 + 2*s*t*x1 + t*t*x2,
+                       s*s*y0 + 2*s*t*y1 + t*t*y2))
+
+
+def get_composite_contours(font, data):
+    """Components that are positioned by matching points are placed at the
+    origin."""
+    out = []
+    offset = 10
+    flags = MORE_COMPONENTS
+    while flags & MORE_COMPONENTS:
+        flags, glyph = unpack_from('>HH', data, offset)
+        offset += 4
+        if flags & ARGS_ARE_WORDS:
+            dx, dy = unpack_from('>hh', data, offset)
+            offset += 4
+        else:
+            dx, dy = unpack_from('>bb', data, offset)
+            offset += 2
+        if not flags & ARGS_ARE_XY_VALUES:
+            dx, dy = 0, 0
+        matrix, offset = get_component_matrix(data, offset, flags)
+        a, b, c, d = matrix
+        for contour in get_contours(font, glyph):
+            out.append(tuple((a*x + c*y + dx, b*x + d*y + dy, on_curve)
+                             for x, y, on_curve in contour))
+    return tuple(out)
+
+
+def get_component_matrix(data, offset, flags):
+    if flags & HAS_SCALE:
+        scale = get_f2dot14(data, offset)
+        return (scale, 0, 0, scale), offset + 2
+    if flags & HAS_XY_SCALE:
+        x_scale, y_scale = (get_f2dot14(data, offset + i) for i in (0, 2))
+        return (x_scale, 0, 0, y_scale), offset + 4
+    if flags & HAS_2X2:
+        matrix = tuple(get_f2dot14(data, offset + i) for i in (0, 2, 4, 6))
+        return matrix, offset + 8
+    return (1, 0, 0, 1), offset
+
+
+def get_f2dot14(data, offset):
+    return unpack_from('>h', data, offset)[0] / 16384
+
+
+###
+##  SUBSET
+#
+
+def get_subset(font, chars):
+    """Returns bytes of TrueType font with only the glyphs of the characters,
+    the missing glyph and components of the composite glyphs. Glyphs keep
+    their indexes, so tables that reference glyphs by index stay valid."""
+    glyphs = get_subset_glyphs(font, chars)
+    records = get_table_records(font.data)
+    tables = {tag: font.data[offset:offset + length]
+              for tag, (offset, length) in records.items()
+              if tag in SUBSET_TABLES}
+    tables['glyf'], tables['loca'] = get_subset_glyf(font, glyphs)
+    tables['head'] = get_subset_head(font)
+    tables['cmap'] = get_subset_cmap(font, chars)
+    tables['post'] = get_subset_post(font)
+    if 'kern' in records:
+        offset, length = records['kern']
+        kern = get_subset_kern(font.data[offset:offset + length], glyphs)
+        if kern:
+            tables['kern'] = kern
+    return get_font_file(tables)
+
+
+def get_subset_glyphs(font, chars):
+    out = {0}
+    pending = [get_glyph(font, a) for a in chars]
+    while pending:
+        glyph = pending.pop()
+        if glyph in out:
+            continue
+        out.add(glyph)
+        data = get_glyph_data(font, glyph)
+        if data and unpack_from('>h', data)[0] < 0:
+            pending.extend(get_components(data))
+    return out
+
+
+def get_components(data):
+    """Returns indexes of the glyphs that composite glyph consists of."""
+    out = []
+    offset = 10
+    flags = MORE_COMPONENTS
+    while flags & MORE_COMPONENTS:
+        flags, glyph = unpack_from('>HH', data, offset)
+        out.append(glyph)
+        offset += 8 if flags & ARGS_ARE_WORDS else 6
+        _, offset = get_component_matrix(data, offset, flags)
+    return out
+
+
+def get_table_records(data):
+    """Returns dictionary of offsets and lengths of the tables by their
+    tags, which, unlike in 'get_tables()', keep their trailing spaces."""
+    no_tables, = unpack_from('>H', data, 4)
+    out = {}
+    for i in range(no_tables):
+        tag, _, offset, length = unpack_from('>4sLLL', data, 12 + i * 16)
+        out[tag.decode('latin-1')] = offset, length
+    return out
+
+
+def get_subset_glyf(font, glyphs):
+    """Returns glyf table with data of only the passed glyphs, and loca table
+    in the long format."""
+    glyf, loca = [], [0]
+    for glyph in range(font.no_glyphs):
+        data = get_glyph_data(font, glyph) if glyph in glyphs else b''
+        glyf.append(data + bytes(-len(data) % 4))
+        loca.append(loca[-1] + len(glyf[-1]))
+    return b''.join(glyf), pack(f'>{len(loca)}L', *loca)
+
+
+def get_subset_head(font):
+    """Returns head table with long loca format and checksum adjustment that
+    gets set by 'get_font_file()'."""
+    head = bytearray(font.data[font.tables['head']:font.tables['head'] + 54])
+    head[8:12] = bytes(4)
+    head[50:52] = pack('>h', 1)
+    return bytes(head)
+
+
+def get_subset_cmap(font, chars):
+    """Returns cmap table with a format 4 subtable that maps each of the
+    characters with a glyph in its own segment."""
+    codes = sorted({ord(a) for a in chars if ord(a) < 0xFFFF and
+                    get_glyph(font, a)})
+    deltas = [(get_glyph(font, chr(a)) - a) & 0xFFFF for a in codes]
+    codes.append(0xFFFF)
+    deltas.append(1)
+    no_segments = len(codes)
+    entry_selector = no_segments.bit_length() - 1
+    search_range = 2 * 2**entry_selector
+    subtable = pack(f'>7H{no_segments}HH{no_segments}H{no_segments}H'
+                    f'{no_segments}H', 4, 16 + no_segments * 8, 0,
+                    no_segments * 2, search_range, entry_selector,
+                    no_segments * 2 - search_range, *codes, 0, *codes,
+                    *deltas, *[0] * no_segments)
+    return pack('>HHHHLHHL', 0, 2, 0, 3, 20, 3, 1, 20) + subtable
+
+
+def get_subset_post(font):
+    """Returns post table of version 3, which has no glyph names."""
+    offset = font.tables['post']
+    return pack('>L', 0x00030000) + font.data[offset + 4:offset + 32]
+
+
+def get_subset_kern(data, glyphs):
+    """Returns kern table with only the pairs of the passed glyphs, or None
+    if there are no such pairs or the table is not a single horizontal
+    subtable of format 0."""
+    version, no_tables = unpack_from('>HH', data)
+    if version != 0 or no_tables != 1:
+        return None
+    _, _, coverage, no_pairs = unpack_from('>HHHH', data, 4)
+    if coverage != 1:
+        return None
+    pairs = [unpack_from('>HHh', data, 18 + i * 6) for i in range(no_pairs)]
+    pairs = [a for a in pairs if a[0] in glyphs and a[1] in glyphs]
+    if not pairs:
+        return None
+    no_pairs = len(pairs)
+    entry_selector = no_pairs.bit_length() - 1
+    search_range = 6 * 2**entry_selector
+    out = [pack('>HHHHHHHHH', 0, 1, 0, 14 + no_pairs * 6, coverage,
+                no_pairs, search_range, entry_selector,
+                no_pairs * 6 - search_range)]
+    out.extend(pack('>HHh', *a) for a in pairs)
+    return b''.join(out)
+
+
+def get_font_file(tables):
+    """Returns bytes of the font with tables sorted by tag and checksums
+    set."""
+    tags = sorted(tables)
+    no_tables = len(tags)
+    entry_selector = no_tables.bit_length() - 1
+    search_range = 16 * 2**entry_selector
+    header = pack('>LHHHH', 0x00010000, no_tables, search_range,
+                  entry_selector, no_tables * 16 - search_range)
+    records, bodies, offsets = [], [], {}
+    offset = 12 + no_tables * 16
+    for tag in tags:
+        table = tables[tag]
+        records.append(pack('>4sLLL', tag.encode('latin-1'),
+                            get_checksum(table), offset, len(table)))
+        bodies.append(table + bytes(-len(table) % 4))
+        offsets[tag] = offset
+        offset += len(bodies[-1])
+    out = bytearray(header + b''.join(records) + b''.join(bodies))
+    adjustment = (CHECKSUM_MAGIC - get_checksum(out)) & 0xFFFFFFFF
+    out[offsets['head'] + 8:offsets['head'] + 12] = pack('>L', adjustment)
+    return bytes(out)
+
+
+def get_checksum(data):
+    data = data + bytes(-len(data) % 4)
+    return sum(unpack_from(f'>{len(data) // 4}L', data)) & 0xFFFFFFFF
@@ -1,12 +1,22 @@
 import ast
 import operator as op
 import re
-from collections import namedtuple
+from collections import OrderedDict, namedtuple
+from functools import lru_cache
+from hashlib import sha1
+from keyword import iskeyword
 from math import pi, cos, sin
 from numbers import Real
+from threading import Lock
 
 
 Point = namedtuple('Point', list('xy'))
+CompiledExp = namedtuple('CompiledExp', ['tokens', 'names', 'fun'])
+
+TOKENS = re.compile('([ +\\-/*()])')
+LETTERS = re.compile('[a-zA-Z]')
+# Number of compiled expressions that are kept.
+EXPRESSIONS_CACHE_SIZE = 4096
 
 OPERATORS = {ast.Add: op.add, ast.Sub: op.sub, ast.Mult: op.mul,
              ast.Div: op.truediv, ast.Pow: op.pow, ast.BitXor: op.xor,
@@ -45,28 +55,77 @@ def get_value_of_exp(exp, dictionary):
     # if isinstance(exp, Number) or isinstance(exp, list):
     if type(exp) != str:
         return exp
-    tokens = [a for a in re.split('([ +\\-/*()])', exp) if a]
-    tokens_out = []
-    for token in tokens:
-        token_out = sub_exp(token, dictionary)
-        tokens_out.append(token_out)
-    exp = ''.join(tokens_out)
-
-    # for key, value in dictionary.items():
-    #     exp = exp.replace(key, str(value))  #!!!!! more specific
-
-    if re.search('[a-zA-Z]', exp):
+    compiled = compile_exp(exp)
+    if len(compiled.tokens) == 1 and exp in dictionary:
+        return dictionary[exp]
+    if compiled.fun:
+        values = [dictionary.get(a) for a in compiled.names]
+        if all(is_number(a) for a in values):
+            return compiled.fun(values)
+    return sub_tokens(compiled.tokens, dictionary)
+
+
+def sub_tokens(tokens, dictionary):
+    exp = ''.join(sub_exp(token, dictionary) for token in tokens)
+    if LETTERS.search(exp):
         return exp
     return eval_expr(exp)
 
 
 def sub_exp(exp, dictionary):
-    for key, value in dictionary.items():
-        if exp == key:
-            return str(value)
+    if exp in dictionary:
+        return str(dictionary[exp])
     return exp
 
 
+def is_number(value):
+    return isinstance(value, Real) and not isinstance(value, bool)
+
+
+###
+##  COMPILE
+#
+
+@lru_cache(maxsize=EXPRESSIONS_CACHE_SIZE)
+def compile_exp(exp):
+    """Splits expression into tokens and compiles it into a function that
+    receives a list with values of the names in the same order as they appear
+    in the 'names' field. Function is None if expression can't be evaluated
+    without the textual substitution."""
+    tokens = tuple(a for a in TOKENS.split(exp) if a)
+    names = tuple(dict.fromkeys(a for a in tokens if LETTERS.search(a)))
+    if not all(a.isidentifier() and not iskeyword(a) for a in names):
+        return CompiledExp(tokens, names, None)
+    try:
+        fun = compile_node(ast.parse(exp, mode='eval').body, names)
+    except (SyntaxError, KeyError, TypeError):
+        fun = None
+    if fun and not names:
+        value = fun(())
+        fun = lambda values: value
+    return CompiledExp(tokens, names, fun)
+
+
+def compile_node(node, names):
+    if isinstance(node, ast.Constant) and type(node.value) in (int, float):
+        value = node.value
+        return lambda values: value
+    elif isinstance(node, ast.Name):
+        i = names.index(node.id)
+        return lambda values: values[i]
+    elif isinstance(node, ast.BinOp):
+        operator = OPERATORS[type(node.op)]
+        left = compile_node(node.left, names)
+        right = compile_node(node.right, names)
+        return lambda values: operator(left(values), right(values))
+    elif isinstance(node, ast.UnaryOp):
+        operator = OPERATORS[type(node.op)]
+        operand = compile_node(node.operand, names)
+        return lambda values: operator(operand(values))
+    else:
+        raise TypeError(node)
+
+
 def eval_expr(expr):
     return eval_(ast.parse(expr, mode='eval').body)
 
@@ -82,6 +141,51 @@ def eval_(node):
         raise TypeError(node)
 
 
+###
+##  VARIABLES
+#
+
+def resolve_variables(variables, elements):
+    """Returns dictionary with resolved values of variables that are used by
+    the elements. Variables get resolved in order of their dependencies, so
+    that each one is resolved before the variables that use it."""
+    out = {}
+    for name in get_names(elements):
+        resolve_variable(name, variables, out, [])
+    return out
+
+
+def resolve_variable(name, variables, resolved, stack):
+    if name in resolved or name not in variables:
+        return
+    if name in stack:
+        cycle = ' -> '.join(stack[stack.index(name):] + [name])
+        raise ValueError(f'Circular definition of variable "{name}": {cycle}.')
+    stack.append(name)
+    value = variables[name]
+    for dependency in get_names([value]):
+        resolve_variable(dependency, variables, resolved, stack)
+    stack.pop()
+    resolved[name] = replace_matched_items([value], resolved)[0]
+
+
+def get_names(elements):
+    """Returns all tokens of expressions in elements that could be variable
+    names."""
+    out = set()
+    if not elements:
+        return out
+    for element in elements:
+        if type(element) in (set, list):
+            out.update(get_names(element))
+        elif type(element) is dict:
+            out.update(get_names([a for a in element.values()
+                                  if type(a) is str]))
+        elif type(element) is str:
+            out.update(compile_exp(element).tokens)
+    return out
+
+
 ###
 ##  UTIL
 #
@@ -121,7 +225,7 @@ def no_enum_error(a_enum, name, dbg_context):
 
 
 def check_args(prms, dbg_context):
-    if not prms.shape.value.min_no_args:
+    if not prms.shape.min_no_args:
         return
     check_args_no(prms, dbg_context)
     check_args_type(prms, dbg_context)
@@ -130,8 +234,8 @@ def check_args(prms, dbg_context):
 def check_args_no(prms, dbg_context):
     shape = prms.shape
     no_args = len(prms.args)
-    min_args = shape.value.min_no_args
-    max_args = len(shape.value.max_args)
+    min_args = shape.min_no_args
+    max_args = len(shape.max_args)
     if no_args < min_args:
         not_enough_args_err(shape, min_args, no_args, dbg_context)
     if no_args > max_args:
@@ -156,7 +260,7 @@ def check_args_type(prms, subgroup):
             msg = f'Argument {arg} of shape "{prms.shape.name}" is a number. ' \
                 f'Subgroup "{subgroup}".'
             raise ValueError(msg)
-        max_arg = prms.shape.value[3][i]
+        max_arg = prms.shape.max_args[i]
         if arg > max_arg:
             msg = f'Argument {arg} of shape "{prms.shape.name}" is larger ' \
                 f'than the maximum allowed value ({max_arg}). ' \
@@ -174,6 +278,43 @@ def write_to_file(filename, text):
         file.write(text)
 
 
+def get_hash(text):
+    return sha1(text.encode()).hexdigest()[:12]
+
+
 def add_defaults(a_list, defaults):
     for i, default in enumerate(defaults):
         yield a_list[i] if i < len(a_list) else default
+
+
+###
+##  CACHE
+#
+
+class Cache:
+    """Thread safe LRU cache with at most size items."""
+
+    __slots__ = ('size', 'items', 'lock')
+
+    def __init__(self, size):
+        self.size = size
+        self.items = OrderedDict()
+        self.lock = Lock()
+
+    def get(self, key):
+        with self.lock:
+            value = self.items.get(key)
+            if value is not None:
+                self.items.move_to_end(key)
+            return value
+
+    def put(self, key, value):
+        with self.lock:
+            self.items[key] = value
+            self.items.move_to_end(key)
+            while len(self.items) > self.size:
+                self.items.popitem(last=False)
+
+    def clear(self):
+        with self.lock:
+            self.items.clear()